@@ -126,6 +126,19 @@ USE_TZ = True
 STATIC_URL = '/static/'
 REDIS_URL = os.getenv('REDIS_URL', 'localhost')
 
+# 'redis' to run simulations in `manage.py run_workers`, 'local' to run them in the web process
+JOB_QUEUE = os.getenv('JOB_QUEUE', 'redis')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# 'double' or 'single', the memory and accuracy trade-off is described at visualize.Antenna.PRECISION
+MODEL_PRECISION = os.getenv('MODEL_PRECISION', 'double')
+
+# per-stage timers of the computations: Server-Timing of the results and /metrics
+STAGE_TIMING = os.getenv('STAGE_TIMING', '1') == '1'
+
+# import the heavy dependencies and prime the models in antennapp/wsgi.py before the workers fork
+WARMUP = os.getenv('WARMUP', '1') == '1'
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 
 django_heroku.settings(locals())
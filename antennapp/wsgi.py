@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'antennapp.settings')
 
 application = get_wsgi_application()
+
+# with gunicorn --preload this runs once in the master, before the workers are forked
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP:
+    from visualize.warmup import warmup
+    warmup(settings.MODEL_PRECISION)
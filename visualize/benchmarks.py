@@ -0,0 +1,231 @@
+import fnmatch
+import platform
+import time
+import tracemalloc
+from statistics import median
+import numpy as np
+
+from .Antenna import Antenna, ControlledConnections, SubArrayControlledConnections, AdaptiveAntenna, \
+    PlanarAntenna, PlanarControlledConnections
+from .core import create_antenna
+from .steering import steering_cache
+
+CASES = dict()
+
+
+def case(name):
+    """
+    Registers a benchmark: the decorated function prepares everything that is not measured
+    and returns the callable that is
+    """
+
+    def register(setup):
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+def cold(func):
+    """
+    The call with an empty steering cache, as the first request for an array size in a fresh worker
+    """
+
+    def call():
+        steering_cache.clear()
+        return func()
+
+    return call
+
+
+def errors(n_array, seed=0):
+    rng = np.random.RandomState(seed)
+    return dict(a_apd=rng.normal(0, 0.1, size=(n_array, 1)), ph_apd=rng.normal(0, np.radians(5), size=(n_array, 1)))
+
+
+def interferences(amount):
+    return [20., -30., 45., -55.][:amount]
+
+
+DESIGN = dict(n_array=29, scan=0, random_state=42, a_sigma=0.1, ph_sigma=5, ph_interference=[20, -30, 45],
+              a=1, a_rand=0.01, ph_rand=0.5, iteration=5, boresight_err='no_err', sample_size=1000, SNR_db=20)
+
+
+for n_array in (16, 64):
+    @case(f'antenna/N={n_array}')
+    def antenna(n_array=n_array):
+        return lambda: Antenna(n_array, **errors(n_array)).get_diagram(0)
+
+    for amount in (1, 4):
+        for iteration in (1, 100):
+            @case(f'controlled_connections/N={n_array}/K={amount}/It={iteration}')
+            def controlled_connections(n_array=n_array, amount=amount, iteration=iteration):
+                return lambda: ControlledConnections(n_array, interferences(amount), iteration=iteration,
+                                                     **errors(n_array)).get_diagram(0)
+
+
+@case('sub_array_controlled_connections/N=64/sub=4/It=10')
+def sub_array_controlled_connections():
+    return lambda: SubArrayControlledConnections(64, interferences(3), iteration=10, sub_array=4,
+                                                 **errors(64)).get_diagram(0)
+
+
+for sample_size in (200, 1000, 10000):
+    for snr in (20, 60):
+        @case(f'adaptive/samples={sample_size}/SNR={snr}')
+        def adaptive(sample_size=sample_size, snr=snr):
+            return lambda: AdaptiveAntenna(29, interferences(3), sample_size=sample_size, SNR_db=snr,
+                                           **errors(29)).get_diagram(0)
+
+
+# the warm-up call of measure fills the steering cache, so the cases above time its hits;
+# their cold variants build the steering matrices in every call
+for name in list(CASES):
+    case(f'{name}/cold')(lambda setup=CASES[name]: cold(setup()))
+
+
+for phi in (0, 30):
+    @case(f'planar/32x32/phi={phi}')
+    def planar(phi=phi):
+        return lambda: PlanarAntenna(32, n_rows=32, phi=phi, **errors(32 * 32)).get_diagram(10)
+
+    @case(f'planar_controlled_connections/32x32/phi={phi}')
+    def planar_controlled_connections(phi=phi):
+        return lambda: PlanarControlledConnections(32, interferences(3), n_rows=32, phi=phi, iteration=5,
+                                                   **errors(32 * 32)).get_diagram(10)
+
+
+@case('planar/32x32/map')
+def planar_map():
+    antenna = PlanarAntenna(32, n_rows=32, **errors(32 * 32))
+    return lambda: antenna.get_map(10)
+
+
+@case('planar/32x32/cuts')
+def planar_cuts():
+    antenna = PlanarAntenna(32, n_rows=32, phi=30, **errors(32 * 32))
+    return lambda: antenna.get_cuts(10, (0, 30, 90))
+
+
+@case('main_lobe_calc')
+def main_lobe_calc():
+    design = create_antenna(dict(DESIGN), 'antenna', image_required=False)
+    return design.main_lobe_calc
+
+
+@case('metrics_calc')
+def metrics_calc():
+    design = create_antenna(dict(DESIGN), 'antenna', image_required=False)
+    return design.metrics_calc
+
+
+@case('get_clutter_info')
+def get_clutter_info():
+    design = create_antenna(dict(DESIGN), 'controlled_connections', image_required=False)
+    return design.get_clutter_info
+
+
+@case('image/DiagramImage')
+def diagram_image():
+    from .image_generator import DiagramImage
+    design = create_antenna(dict(DESIGN), 'controlled_connections', image_required=False)
+    return DiagramImage(design.antenna, design.diagram, design.base_diagram).get_image
+
+
+@case('image/ClutterImage')
+def clutter_image():
+    from .image_generator import ClutterImage
+    design = create_antenna(dict(DESIGN), 'adaptive_filtering', image_required=False)
+    return ClutterImage(design.antenna).get_image
+
+
+@case('image/ScatterImage')
+def scatter_image():
+    from .image_generator import ScatterImage
+    design = create_antenna(dict(DESIGN), 'adaptive_filtering', image_required=False)
+    return ScatterImage(design.antenna).get_image
+
+
+@case('image/SweepImage')
+def sweep_image():
+    from .image_generator import SweepImage
+    design = create_antenna(dict(DESIGN), 'controlled_connections', image_required=False)
+    scans = np.arange(-45, 46, 1.)
+    diagrams = 20 * np.log10(design.antenna.get_diagrams(scans))
+    return SweepImage(design.antenna, diagrams, scans).get_image
+
+
+@case('image/PlanarImage')
+def planar_image():
+    from .image_generator import PlanarImage
+    design = create_antenna(dict(DESIGN, n_array=32, n_rows=32, phi=30), 'controlled_connections',
+                            image_required=False)
+    return PlanarImage(design.antenna, *design.pattern_map, *design.cuts).get_image
+
+
+@case('image/ConvergenceImage')
+def convergence_image():
+    from .image_generator import ConvergenceImage
+    design = create_antenna(dict(DESIGN), 'adaptive_filtering', image_required=False)
+    counts, depths = design.antenna.convergence(0)
+    return ConvergenceImage(design.antenna, counts, depths).get_image
+
+
+def measure(func, repeat=5, sample_time=0.05):
+    """
+    Wall time per call over repeat samples after a warm-up call, every sample is long enough
+    (sample_time) to rise above the timer noise, and the peak of the memory traced during a call
+    """
+
+    start = time.perf_counter()
+    func()
+    number = max(1, int(sample_time / max(time.perf_counter() - start, 1e-9)))
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'min': min(times), 'median': median(times), 'repeat': repeat, 'number': number,
+            'peak_mb': peak / 2 ** 20}
+
+
+def run(patterns=None, repeat=5, report=None):
+    results = dict()
+    for name, setup in CASES.items():
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = measure(setup(), repeat)
+        if report is not None:
+            report(name, results[name])
+
+    return {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform(), 'processor': platform.processor()},
+        'results': results
+    }
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Cases whose median time or peak memory grew by more than threshold against the baseline:
+    (name, metric, ratio)
+    """
+
+    regressions = list()
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        for metric in ('median', 'peak_mb'):
+            ratio = current[metric] / previous[metric] if previous[metric] else 1.
+            if ratio > 1 + threshold:
+                regressions.append((name, metric, ratio))
+    return regressions
@@ -1,94 +1,293 @@
+import hashlib
+import json
 import numpy as np
-from numpy import log10, round, abs
-import pandas as pd
+from numpy import log10, round
 
-from .image_generator import DiagramImage, ClutterImage, ScatterImage
-from .Antenna import Antenna, ControlledConnections, AdaptiveAntenna
+# matplotlib (image_generator) is imported at first use, it takes most of the import time
+from .Antenna import Antenna, ControlledConnections, AdaptiveAntenna, PlanarAntenna, PlanarControlledConnections
+from .pattern_metrics import pattern_metrics
+from .timing import stage
+
+# bump whenever a change in the models changes the results
+MODEL_VERSION = 5
+# bump whenever a change in image_generator changes the images
+RENDERER_VERSION = 1
 
 
 class DesignedAntenna:
-    def __init__(self, antenna_params, image_required=True):
+    """
+    A design is a graph of named intermediate products (errors, model, pattern, base pattern,
+    metrics, images...). A product is computed on first access by the method listed
+    in `products` and then shared by everything that needs it, so every antenna type
+    does only the work its result page shows
+    """
+
+    # product: (method computing it, timing stage or None if it is cheap)
+    products = {
+        'errors': ('generate_errors', 'errors'),
+        'antenna': ('create_model', 'model'),
+        'diagram_in_times': ('diagram_calc', 'diagram'),
+        'diagram': ('log_diagram', None),
+        'metrics': ('metrics_calc', 'metrics'),
+        'image': ('get_image', 'images'),
+        'context': ('get_context', None),
+        # timed as stage planar inside, linear designs have neither
+        'pattern_map': ('map_calc', None),
+        'cuts': ('cuts_calc', None),
+        'planar_image': ('get_planar_image', 'images')
+    }
+    # computed for every design, in this order, and for the result page
+    required = ('errors', 'antenna', 'diagram', 'metrics')
+    shown = required + ('image', 'context', 'pattern_map', 'cuts', 'planar_image')
+    # planes of the cuts of a planar array, the plane of the scan is added to them
+    cut_planes = (0., 90.)
+
+    def __init__(self, antenna_params, image_required=True, seed=None, progress=None):
         self.scan = antenna_params.get('scan', 0)
         self.antenna_params = antenna_params
-        self.generate_errors()
-        self.antenna = self.create_model()
-        self.diagram_in_times = self.antenna.get_diagram(self.scan)
-        self.diagram = 20 * log10(self.diagram_in_times)
-        if image_required:
-            self.main_lobe = self.main_lobe_calc()
-            if hasattr(self, 'base_antenna'):
-                self.image = DiagramImage(self.antenna, self.diagram, self.base_antenna.diagram).get_image()
+        self.seed = seed
+        self.progress = progress
+        for name in self.shown if image_required else self.required:
+            getattr(self, name)
+
+    def __getattr__(self, name):
+        if name not in type(self).products:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+        method, stage_name = type(self).products[name]
+        try:
+            if stage_name is None:
+                value = getattr(self, method)()
             else:
-                self.image = DiagramImage(self.antenna, self.diagram).get_image()
-            self.context = self.get_context()
+                with stage(stage_name):
+                    value = getattr(self, method)()
+        except AttributeError as error:
+            # would be taken for a missing product otherwise
+            raise RuntimeError(f'{name}: {error}') from error
+        setattr(self, name, value)
+        return value
+
+    @property
+    def main_lobe(self):
+        return self.metrics['beamwidth']
+
+    @property
+    def n_elements(self):
+        return self.antenna_params['n_array'] * (self.antenna_params['n_rows'] if self.planar else 1)
+
+    @property
+    def planar(self):
+        return (self.antenna_params.get('n_rows') or 1) > 1
 
     def create_model(self):
-        return Antenna(**self.antenna_params)
+        self.report('model')
+        factory = PlanarAntenna if self.planar else Antenna
+        return factory(**dict(self.antenna_params, **self.errors))
+
+    def diagram_calc(self):
+        self.report('diagram')
+        return self.antenna.get_diagram(self.scan)
+
+    def log_diagram(self):
+        return 20 * log10(self.diagram_in_times)
+
+    def get_image(self):
+        self.report('images')
+        from .image_generator import DiagramImage
+        base_diagram = self.base_diagram if 'base_diagram' in self.shown else None
+        return DiagramImage(self.antenna, self.diagram, base_diagram).get_image()
+
+    def map_calc(self):
+        """
+        u, v and the pattern of a planar array over them, dB; None for a linear one
+        """
+
+        if not self.planar:
+            return None
+        self.report('planar')
+        with stage('planar'):
+            u, v, pattern = self.antenna.get_map(self.scan)
+        return u, v, 20 * log10(pattern)
+
+    def cuts_calc(self):
+        """
+        Planes (°) and the cuts of the pattern of a planar array in them, dB; None for a linear one
+        """
+
+        if not self.planar:
+            return None
+        phis = sorted(set(self.cut_planes) | {float(np.degrees(self.antenna.phi))})
+        with stage('planar'):
+            cuts = self.antenna.get_cuts(self.scan, phis)
+        return phis, 20 * log10(cuts)
+
+    def get_planar_image(self):
+        if self.pattern_map is None:
+            return None
+        from .image_generator import PlanarImage
+        return PlanarImage(self.antenna, *self.pattern_map, *self.cuts).get_image()
+
+    def report(self, stage, **info):
+        if self.progress is not None:
+            self.progress(stage, **info)
+
+    def report_iteration(self, iteration, iterations):
+        self.report('iterations', iteration=iteration, iterations=iterations)
+
+    def get_result(self):
+        """
+        Everything the result page shows, as plain data that can be cached
+        """
+
+        result = {
+            'theta_deg': self.antenna.theta_deg,
+            'diagram': self.diagram,
+            'base_diagram': self.base_diagram if 'base_diagram' in self.shown else None,
+            'cl_index': getattr(self.antenna, 'cl_index', None)
+        }
+        for name in ('image', 'context', 'planar_image', 'clutter_info', 'clutter_image', 'scatter_image',
+                     'convergence_info', 'convergence_image'):
+            if name in self.shown and getattr(self, name) is not None:
+                result[name] = getattr(self, name)
+        return result
 
     def get_context(self):
         context = list()
         context.append(('Количество излучателей', self.antenna.N))
+        if self.planar:
+            context.append(('Размер панели', f'{self.antenna.Nx} x {self.antenna.Ny}'))
+            context.append(('Плоскость сканирования φ, °', round(np.degrees(self.antenna.phi), 2)))
         context.append(('Направление сканирования', self.scan))
         context.append(('Ширина главного лепестка Δ, °', round(self.main_lobe, 2)))
+        context.append(('Ширина главного лепестка по нулям, °', round(self.metrics['null_width'], 2)))
+        context.append(('Максимальный УБЛ, дБ', round(self.metrics['sidelobe_peak'], 2)))
+        context.append(('Средний УБЛ, дБ', round(self.metrics['sidelobe_mean'], 2)))
         context.append(('СКО амплитудных ошибок',  round(np.std(self.antenna.A_apd), 3)))
         context.append(('СКО фазовых ошибок, °', round(np.degrees(np.std(self.antenna.Fi_apd)), 3)))
         return context
 
+    def random_generator(self):
+        """
+        Errors are drawn from random_state unless a seed (int or SeedSequence) is given,
+        then from an independent Generator stream
+        """
+
+        if self.seed is None:
+            return np.random.RandomState(self.antenna_params.get('random_state', 42))
+        return np.random.default_rng(self.seed)
+
     def generate_errors(self):
-        np.random.seed(self.antenna_params.get('random_state', 42))
+        """
+        Amplitude and phase errors of the elements, model parameters
+        """
+
+        self.report('errors')
+        self.rng = self.random_generator()
         a_sigma = self.antenna_params.get('a_sigma', 0)
         ph_sigma = self.antenna_params.get('ph_sigma', 0)
 
-        N = self.antenna_params['n_array']
-        self.antenna_params['a_apd'] = np.random.normal(0, a_sigma, size=(N, 1))
-        self.antenna_params['ph_apd'] = np.random.normal(0, np.radians(ph_sigma), size=(N, 1))
-        return N
+        N = self.n_elements
+        return {
+            'a_apd': self.rng.normal(0, a_sigma, size=(N, 1)),
+            'ph_apd': self.rng.normal(0, np.radians(ph_sigma), size=(N, 1))
+        }
+
+    def metrics_calc(self, diagram=None, scan_ind=None):
+        diagram = self.diagram if diagram is None else diagram
+        scan_ind = self.antenna.scan_ind[0] if scan_ind is None else scan_ind
+        return pattern_metrics(self.antenna.theta_deg, diagram, scan_ind,
+                               getattr(self.antenna, 'cl_index', None) or [])
+
+    def main_lobe_calc(self, diagram=None, scan_ind=None):
+        """
+        -3 dB beamwidth of the main lobe, °
+        """
+
+        return self.metrics_calc(diagram, scan_ind)['beamwidth']
 
-    def main_lobe_calc(self):
-        field_of_search = 500
-        sector = self.diagram[self.antenna.scan_ind[0]-field_of_search: self.antenna.scan_ind[0]]
-        ind_3dB = self.antenna.scan_ind[0] - field_of_search + self.antenna.value_quantizer([-3], sector)
-        main_lobe = abs(2 * (self.antenna.theta_deg[self.antenna.scan_ind[0]] - self.antenna.theta_deg[ind_3dB])[0])
-        return main_lobe
+    def sidelobe_calc(self):
+        """
+        Peak sidelobe level, dB: the highest point beyond the first nulls around the main lobe peak
+        """
+
+        return self.metrics['sidelobe_peak']
 
 
 class DesignedControlledConnections(DesignedAntenna):
-    def __init__(self, antenna_params, image_required=True):
-        self._bore_err = None
-        self.base_antenna = DesignedAntenna(antenna_params, image_required=False)
-        super().__init__(antenna_params=antenna_params, image_required=image_required)
-        self.clutter_info = self.get_clutter_info()
+    """
+    Shown against the base pattern: an ordinary array with the same amplitude and phase errors
+    """
+
+    products = dict(DesignedAntenna.products, **{
+        'base_antenna': ('create_base_model', None),
+        'base_diagram_in_times': ('base_diagram_calc', 'base'),
+        'base_diagram': ('log_base_diagram', None),
+        'clutter_info': ('get_clutter_info', 'clutter_info')
+    })
+    # after the pattern: the base pattern is evaluated on the grid refined for it
+    shown = DesignedAntenna.required + ('base_diagram', 'image', 'context', 'pattern_map', 'cuts', 'planar_image',
+                                        'clutter_info')
 
     def create_model(self):
-        return ControlledConnections(**self.antenna_params)
+        self.report('model')
+        factory = PlanarControlledConnections if self.planar else ControlledConnections
+        return factory(progress=self.report_iteration, **dict(self.antenna_params, **self.errors))
+
+    def create_base_model(self):
+        errors = {name: self.errors[name] for name in ('a_apd', 'ph_apd')}
+        factory = PlanarAntenna if self.planar else Antenna
+        return factory(**dict(self.antenna_params, **errors))
+
+    def base_diagram_calc(self):
+        self.report('base')
+        if self.antenna.grid != 'uniform':
+            self.base_antenna.fix_grid(self.antenna.grid_index)
+        return self.base_antenna.get_diagram(self.scan)
+
+    def log_base_diagram(self):
+        return 20 * log10(self.base_diagram_in_times)
 
     def generate_errors(self):
-        N = super().generate_errors()
+        errors = super().generate_errors()
+        N = self.n_elements
         a_rand_sigma = self.antenna_params.get('a_rand', 0)
         ph_rand_sigma = self.antenna_params.get('ph_rand', 0)
-        self.antenna_params['a_rand'] = np.random.normal(0, a_rand_sigma, size=(N, 1))
-        self.antenna_params['ph_rand'] = np.random.normal(0, np.radians(ph_rand_sigma), size=(N, 1))
+        errors['a_rand'] = self.rng.normal(0, a_rand_sigma, size=(N, 1))
+        errors['ph_rand'] = self.rng.normal(0, np.radians(ph_rand_sigma), size=(N, 1))
 
         if self.antenna_params.get('boresight_err'):
-            self.antenna_params['boresight_err'] = self.generate_boresight_errors(
+            errors['boresight_err'] = self.generate_boresight_errors(
                 len(self.antenna_params.get('ph_interference')))
+        return errors
 
     def generate_boresight_errors(self, amount):
+        """
+        Boresight errors in grid steps, None if there are none
+        """
+
         random_sample = None
-        angle_step = self.base_antenna.antenna.theta_deg[-2] - self.base_antenna.antenna.theta_deg[-1]
 
         if self.antenna_params.get('boresight_err') == 'small_err':
-            random_sample = np.random.choice([-3, -2, 2, 3], amount)
+            random_sample = self.rng.choice([-3, -2, 2, 3], amount)
 
         if self.antenna_params.get('boresight_err') == 'med_err':
-            random_sample = np.random.choice([-5, -4, 4, 5], amount)
+            random_sample = self.rng.choice([-5, -4, 4, 5], amount)
 
         if self.antenna_params.get('boresight_err') == 'large_err':
-            random_sample = np.random.choice([-10, -9, -8, 8, 9, 10], amount)
+            random_sample = self.rng.choice([-10, -9, -8, 8, 9, 10], amount)
 
-        self._bore_err = np.zeros(amount) if random_sample is None else angle_step * random_sample
         return random_sample
 
+    def boresight_errors(self):
+        """
+        Boresight errors, °, None if the design has no boresight_err parameter
+        """
+
+        if 'boresight_err' not in self.errors:
+            return None
+        steps = self.errors['boresight_err']
+        amount = len(self.antenna.cl_index)
+        return np.zeros(amount) if steps is None else -np.degrees(self.antenna.step) * steps
+
     def get_context(self):
         context = super().get_context()
         context.append(('Количество итераций', self.antenna.It))
@@ -97,46 +296,98 @@ class DesignedControlledConnections(DesignedAntenna):
         return context
 
     def get_clutter_info(self):
-        cancelling_av = round(20 * np.log10(np.mean([self.diagram_in_times[self.antenna.cl_index]])), 2)
-        cancelling_av_rel = round(20 * np.log10(
-            np.mean([self.diagram_in_times[self.antenna.cl_index] /
-                     self.base_antenna.diagram_in_times[self.antenna.cl_index]])
-        ), 2)
-
-        clutter_info = pd.DataFrame({
-            'Направление, °': [round(n, 2) for n in self.antenna.theta_deg[self.antenna.cl_index]] + ['Среднее'],
-            'Подавление абсолютное, дБ': [round(n, 2) for n in self.diagram[self.antenna.cl_index]] + [cancelling_av],
-            'Подавление относительное, дБ': [round(n, 2) for n in (self.diagram[self.antenna.cl_index]
-                                             - self.base_antenna.diagram[self.antenna.cl_index])] + [cancelling_av_rel]
-                      })
-
-        if self._bore_err is not None:
+        cl_index = self.antenna.cl_index
+        absolute = self.metrics['null_depths']
+        # in double whatever the model precision, float32 values do not round to 2 decimals
+        diagram, base_diagram = (np.asarray(values[cl_index], float) for values in (self.diagram, self.base_diagram))
+        in_times, base_in_times = (np.asarray(values[cl_index], float)
+                                   for values in (self.diagram_in_times, self.base_diagram_in_times))
+        relative = diagram - base_diagram
+        cancelling_av = round(20 * np.log10(np.mean(in_times)), 2)
+        cancelling_av_rel = round(20 * np.log10(np.mean(in_times / base_in_times)), 2)
+
+        columns = ['Направление, °', 'Подавление абсолютное, дБ', 'Подавление относительное, дБ']
+        parameters = [[float(round(angle, 2)), float(round(value, 2)), float(round(value_rel, 2))]
+                      for angle, value, value_rel in zip(self.antenna.theta_deg[cl_index], absolute, relative)]
+        parameters.append(['Среднее', float(cancelling_av), float(cancelling_av_rel)])
+
+        bore_err = self.boresight_errors()
+        if bore_err is not None:
+            columns.append('Ошибка пеленга')
             bore_err = ['Δ/' + str(round(self.main_lobe / np.absolute(n), 2)) if n != 0
-                        else 0 for n in self._bore_err]
-            bore_err_col = pd.Series(bore_err + ['—'])
-            clutter_info.loc[:, 'Ошибка пеленга'] = bore_err_col
+                        else 0 for n in bore_err]
+            for row, value in zip(parameters, bore_err + ['—']):
+                row.append(value)
 
-        prepared_columns = list(clutter_info)
-        prepared_values = [clutter_info.loc[row].tolist() for row in range(clutter_info.shape[0])]
-
-        prepared_data = {
-            'columns': prepared_columns,
-            'parameters': prepared_values
+        return {
+            'columns': columns,
+            'parameters': parameters
         }
 
-        return prepared_data
-
 
 class DesignedAdaptiveFiltering(DesignedControlledConnections):
-    def __init__(self, antenna_params, image_required=True):
-        super().__init__(antenna_params=antenna_params, image_required=image_required)
-        if self.antenna_params.get('clatter_image_required'):
-            self.clutter_image = ClutterImage(self.antenna).get_image()
-        if self.antenna_params.get('scatter_image_required'):
-            self.scatter_image = ScatterImage(self.antenna).get_image()
+    products = dict(DesignedControlledConnections.products, **{
+        'clutter_image': ('get_clutter_image', 'images'),
+        'scatter_image': ('get_scatter_image', 'images'),
+        'convergence': ('convergence_calc', 'convergence'),
+        'convergence_info': ('get_convergence_info', 'images'),
+        'convergence_image': ('get_convergence_image', 'images')
+    })
+    # the adaptive filter is modelled for linear arrays only
+    planar = False
+    shown = DesignedControlledConnections.shown + ('clutter_image', 'scatter_image', 'convergence',
+                                                   'convergence_info', 'convergence_image')
 
     def create_model(self):
-        return AdaptiveAntenna(**self.antenna_params)
+        self.report('model')
+        return AdaptiveAntenna(**dict(self.antenna_params, **self.errors))
+
+    def generate_errors(self):
+        # neither residual errors of the connections nor boresight errors: the weights are estimated
+        return DesignedAntenna.generate_errors(self)
+
+    def get_clutter_image(self):
+        if not self.antenna_params.get('clatter_image_required'):
+            return None
+        from .image_generator import ClutterImage
+        return ClutterImage(self.antenna).get_image()
+
+    def get_scatter_image(self):
+        if not self.antenna_params.get('scatter_image_required'):
+            return None
+        from .image_generator import ScatterImage
+        return ScatterImage(self.antenna).get_image()
+
+    def convergence_calc(self):
+        """
+        Counts and depths of the recursive weights estimate, None unless convergence_required
+        """
+
+        if not self.antenna_params.get('convergence_required'):
+            return None
+        self.report('convergence')
+        # about a thousand points on the curves whatever the sample size
+        every = max(1, self.antenna.sample_size // 1000)
+        return self.antenna.convergence(self.scan, forgetting=self.antenna_params.get('forgetting') or 1.,
+                                        window=self.antenna_params.get('window'), every=every)
+
+    def get_convergence_info(self):
+        if self.convergence is None:
+            return None
+        counts, depths = self.convergence
+        rows = np.unique(np.geomspace(1, len(counts), 10).astype(int) - 1)
+        columns = ['Число отсчетов'] + [f'Подавление {round(angle, 2)}°, дБ'
+                                        for angle in self.antenna.theta_deg[self.antenna.cl_index]]
+        return {
+            'columns': columns,
+            'parameters': [[counts[row]] + list(round(depths[row], 2)) for row in rows]
+        }
+
+    def get_convergence_image(self):
+        if self.convergence is None:
+            return None
+        from .image_generator import ConvergenceImage
+        return ConvergenceImage(self.antenna, *self.convergence).get_image()
 
     def get_context(self):
         context = DesignedAntenna.get_context(self)
@@ -145,7 +396,86 @@ class DesignedAdaptiveFiltering(DesignedControlledConnections):
         return context
 
 
-def create_antenna(antenna_params, antenna_type):
+class ScanSweep:
+    """
+    Beam steering map of a design: the model is built once and only
+    the scan phase changes from row to row
+    """
+
+    def __init__(self, antenna_params, antenna_type, scans, image_required=True, progress=None):
+        self.scans = np.asarray(scans, dtype=float)
+        if progress is not None:
+            progress('sweep')
+        self.design = create_antenna(antenna_params, antenna_type, image_required=False)
+        self.antenna = self.design.antenna
+
+        self.diagrams_in_times = self.antenna.get_diagrams(self.scans)
+        self.diagrams = 20 * log10(self.diagrams_in_times)
+        self.base_diagrams_in_times = None
+        if 'base_diagram' in self.design.shown:
+            base_antenna = self.design.base_antenna
+            if self.antenna.grid != 'uniform':
+                base_antenna.fix_grid(self.antenna.grid_index)
+            self.base_diagrams_in_times = base_antenna.get_diagrams(self.scans)
+
+        self.main_lobes = np.array([self.design.main_lobe_calc(diagram, scan_ind) for diagram, scan_ind
+                                    in zip(self.diagrams, self.antenna.scan_ind)])
+        self.suppression, self.suppression_rel = self.get_suppression()
+        if image_required:
+            from .image_generator import SweepImage
+            self.image = SweepImage(self.antenna, self.diagrams, self.scans).get_image()
+            self.sweep_info = self.get_sweep_info()
+
+    def get_result(self):
+        """
+        What the sweep page shows, as plain data that can be cached
+        """
+
+        return {'image': self.image, 'sweep_info': self.sweep_info}
+
+    def get_suppression(self):
+        if self.base_diagrams_in_times is None:
+            return None, None
+        cl_index = self.antenna.cl_index
+        suppression = 20 * np.log10(np.mean(self.diagrams_in_times[:, cl_index], axis=1))
+        suppression_rel = 20 * np.log10(np.mean(self.diagrams_in_times[:, cl_index] /
+                                                self.base_diagrams_in_times[:, cl_index], axis=1))
+        return suppression, suppression_rel
+
+    def get_sweep_info(self):
+        columns = ['Направление сканирования, °', 'Ширина главного лепестка Δ, °']
+        values = [self.scans, round(self.main_lobes, 2)]
+        if self.suppression is not None:
+            columns += ['Подавление среднее абсолютное, дБ', 'Подавление среднее относительное, дБ']
+            values += [round(self.suppression, 2), round(self.suppression_rel, 2)]
+
+        return {
+            'columns': columns,
+            'parameters': [list(row) for row in zip(*values)]
+        }
+
+
+def canonical_params(antenna_params):
+    """
+    Parameters with the list ones (interference directions) sorted. The models take
+    the directions in the given order, so a design is computed from these and hashed as these
+    """
+
+    return {name: sorted(value) if isinstance(value, (list, tuple)) else value
+            for name, value in antenna_params.items()}
+
+
+def design_key(antenna_params, antenna_type):
+    """
+    Content address of a design: the same parameters always give the same result and images
+    """
+
+    canonical = json.dumps([MODEL_VERSION, RENDERER_VERSION, antenna_type, canonical_params(antenna_params)],
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def create_antenna(antenna_params, antenna_type, image_required=True, seed=None, progress=None):
 
     factory = DesignedAntenna
     if antenna_type == 'controlled_connections':
@@ -153,5 +483,18 @@ def create_antenna(antenna_params, antenna_type):
     if antenna_type == 'adaptive_filtering':
         factory = DesignedAdaptiveFiltering
 
-    return factory(antenna_params)
+    return factory(antenna_params, image_required=image_required, seed=seed, progress=progress)
+
+
+def sweep_key(user_key, scans):
+    """
+    Content address of the scan sweep of the design user_key
+    """
+
+    canonical = json.dumps([user_key, [float(scan) for scan in scans]], separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def sweep_antenna(antenna_params, antenna_type, scans, image_required=True, progress=None):
+    return ScanSweep(antenna_params, antenna_type, scans, image_required=image_required, progress=progress)
 
@@ -0,0 +1,53 @@
+import numpy as np
+
+# -inf of a perfect null is not representable in JSON
+FLOOR_DB = -300
+
+
+def minmax_indices(series, points, keep=()):
+    """
+    Indices of a peak-preserving reduction of the series to about points samples:
+    the range is split into buckets and the minimum and the maximum of every series
+    are kept in each of them, so nulls and lobes survive. Indices in keep and both
+    ends are always kept
+    """
+
+    series = [np.asarray(values, float) for values in series]
+    n = len(series[0])
+    buckets = max(int(points) // (2 * len(series)), 1)
+    if n <= max(int(points), 2):
+        return np.arange(n)
+
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    offsets = np.arange(buckets)[:, None] * size
+    indices = [np.array([0, n - 1]), np.asarray(keep, int).ravel()]
+    for values in series:
+        values = np.nan_to_num(values, nan=FLOOR_DB, neginf=FLOOR_DB)
+        blocks = np.pad(values, (0, pad), mode='edge').reshape(buckets, size)
+        indices.append((offsets + np.argmin(blocks, axis=1)[:, None]).ravel())
+        indices.append((offsets + np.argmax(blocks, axis=1)[:, None]).ravel())
+    return np.unique(np.clip(np.concatenate(indices), 0, n - 1))
+
+
+def decimate_pattern(result, points=2000):
+    """
+    Pattern of a cached result reduced for client-side plotting. Returns the columns
+    and the positions of the interference directions in the reduced arrays
+    """
+
+    theta_deg = np.asarray(result['theta_deg'], float).ravel()
+    columns = {'theta_deg': theta_deg, 'diagram': np.asarray(result['diagram'], float).ravel()}
+    if result.get('base_diagram') is not None:
+        columns['base_diagram'] = np.asarray(result['base_diagram'], float).ravel()
+
+    cl_index = np.asarray(result['cl_index'] if result.get('cl_index') is not None else [], int).ravel()
+    # interference nulls and the main lobe peak survive any target point count
+    keep = np.append(cl_index, np.argmax(columns['diagram']))
+
+    series = [values for name, values in columns.items() if name != 'theta_deg']
+    index = minmax_indices(series, points, keep=keep)
+    columns = {name: values[index] if name == 'theta_deg' else np.maximum(values[index], FLOOR_DB)
+               for name, values in columns.items()}
+    interferences = np.searchsorted(index, cl_index)
+    return columns, interferences
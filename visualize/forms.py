@@ -1,3 +1,4 @@
+import numpy as np
 from django import forms
 from django.core.validators import RegexValidator
 
@@ -11,6 +12,9 @@ class InputForm(forms.Form):
 
 class AntennaForm(forms.Form):
     n_array = forms.IntegerField(label='Количество излучателей', min_value=2, max_value=100, initial=29)
+    n_rows = forms.IntegerField(label='Количество строк панели', min_value=1, max_value=64, initial=1,
+                                help_text='больше одной для планарной АФАР.')
+    phi = forms.FloatField(label='Плоскость сканирования φ', min_value=0, max_value=180, initial=0.0, required=True)
     scan = forms.FloatField(label='Направление сканирования', min_value=-45, max_value=45, initial=0.0, required=True)
     random_state = forms.IntegerField(label='Случайное состояние', min_value=0, initial=42)
     a_sigma = forms.FloatField(label='СКО амплитудных ошибок', min_value=0, max_value=1, initial=0.1, required=True)
@@ -34,9 +38,10 @@ class ControlledConnectionsForm(AntennaForm):
 
     def clean_ph_interference(self):
         try:
-            self.cleaned_data['ph_interference'] = [float(x) for x in
-                                                    set(self.cleaned_data['ph_interference'].replace(' ',
-                                                                                                     '').split(','))]
+            # sorted: the same directions always give the same design and the same key
+            self.cleaned_data['ph_interference'] = sorted({float(x) for x in
+                                                           self.cleaned_data['ph_interference'].replace(' ',
+                                                                                                        '').split(',')})
             for x in self.cleaned_data['ph_interference']:
                 if not (-90 <= x <= 90):
                     raise ValueError
@@ -47,9 +52,44 @@ class ControlledConnectionsForm(AntennaForm):
 
 
 class AdaptiveFilteringForm(ControlledConnectionsForm):
-    sample_size = forms.IntegerField(label='Объем выборки', min_value=10, max_value=1000, initial=200)
+    sample_size = forms.IntegerField(label='Объем выборки', min_value=10, max_value=100000, initial=200)
     SNR_db = forms.FloatField(label='Отношение помеха / шум', min_value=0, max_value=200, initial=20,
                               required=True)
     clatter_image_required = forms.BooleanField(label='Отобразить осциллограммы помех', required=False)
     scatter_image_required = forms.BooleanField(label='Визуализировать матрицу рассеяния', required=False)
-    iteration, a, a_rand, ph_rand, boresight_err = None, None, None, None, None
+    convergence_required = forms.BooleanField(label='Построить кривые сходимости', required=False)
+    forgetting = forms.FloatField(label='Коэффициент забывания', min_value=0.5, max_value=1, initial=1,
+                                  required=False)
+    window = forms.IntegerField(label='Скользящее окно, отсчетов', min_value=2, max_value=100000,
+                                required=False)
+    iteration, a, a_rand, ph_rand, boresight_err, n_rows, phi = None, None, None, None, None, None, None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        forgetting, n_array = cleaned_data.get('forgetting'), cleaned_data.get('n_array')
+        # the memory 1 / (1 - forgetting) of the recursive estimate must hold several snapshots
+        # per element, or the estimated covariance is close to singular
+        if forgetting is not None and n_array is not None and forgetting < 1 - 1 / (2 * n_array):
+            raise forms.ValidationError(f'Коэффициент забывания для {n_array} излучателей '
+                                        f'должен быть не меньше {round(1 - 1 / (2 * n_array), 4)}')
+        return cleaned_data
+
+
+class SweepForm(forms.Form):
+    # every scan is a pattern of the model and one of the base array in memory
+    max_scans = 181
+    scan_min = forms.FloatField(label='Начальное направление сканирования', min_value=-45, max_value=45, initial=-45)
+    scan_max = forms.FloatField(label='Конечное направление сканирования', min_value=-45, max_value=45, initial=45)
+    scan_step = forms.FloatField(label='Шаг сканирования', min_value=0.1, max_value=90, initial=1)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('scan_min', 0) > cleaned_data.get('scan_max', 0):
+            raise forms.ValidationError('Начальное направление должно быть не больше конечного')
+        if not self.errors and len(self.get_scans()) > self.max_scans:
+            raise forms.ValidationError(f'Не больше {self.max_scans} направлений сканирования: увеличьте шаг')
+        return cleaned_data
+
+    def get_scans(self):
+        scan_min, scan_max, scan_step = (self.cleaned_data[key] for key in ('scan_min', 'scan_max', 'scan_step'))
+        return np.arange(scan_min, scan_max + scan_step / 2, scan_step)
@@ -1,13 +1,14 @@
 from abc import ABC, abstractmethod
-import pandas as pd
-from pandas.plotting import scatter_matrix
+import threading
 import numpy as np
 import matplotlib
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from cycler import cycler
 from io import BytesIO
 import base64
 import warnings
+from .timing import stage
 warnings.filterwarnings("ignore")
 
 
@@ -16,11 +17,43 @@ matplotlib.use('Agg')
 LUCKY_NUMBER = 25
 
 
+class FigurePool:
+    """
+    One pre-styled figure per image type and thread. Figures are built with the
+    object-oriented API on an Agg canvas, so nothing is registered in pyplot's
+    global figure manager and nothing is shared between request threads
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, name, factory):
+        figures = self._local.__dict__
+        if name not in figures:
+            figures[name] = factory()
+        return figures[name]
+
+
+figures = FigurePool()
+
+
+def new_figure(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
 def binary_saver(func):
     def wrapped(inst):
-        func(inst)
-        img_in_memory = BytesIO()
-        inst.fig.savefig(img_in_memory, format='png', bbox_inches='tight', transparent="True", pad_inches=0)
+        with stage(f'render.{type(inst).__name__}'):
+            func(inst)
+            img_in_memory = BytesIO()
+            try:
+                inst.fig.savefig(img_in_memory, format='png', bbox_inches='tight', transparent="True",
+                                 pad_inches=0)
+            finally:
+                # data of the request must not outlive it in the pooled figure
+                inst.release()
         image = base64.b64encode(img_in_memory.getvalue()).decode()
         return image
 
@@ -37,26 +70,40 @@ class AbstractImage(ABC):
     def get_image(self):
         pass
 
+    def release(self):
+        pass
+
 
 class DiagramImage(AbstractImage):
+    x_min = -60
+    x_max = 60
+
     def __init__(self, model, diagram, base_diagram=None):
         super().__init__(model=model)
         self._figure = diagram
         self._base_figure = base_diagram
 
-    def base_image(self, y_min):
-        x_min = -60
-        x_max = -x_min
-        fig = plt.figure(figsize=(10, 6))
+    @classmethod
+    def create_figure(cls):
+        fig = new_figure(figsize=(10, 6))
         ax = fig.add_subplot(1, 1, 1)
-        ax.plot(self._model.theta_deg, self._figure, color='#49CED4', lw=2, label='ДН адаптивной АФАР')
-        ax.set_xlim(x_min, x_max)
-        ax.set_ylim(y_min, 0)
-        ax.set_yticks(np.arange(y_min, 0, int(abs(y_min) / LUCKY_NUMBER)))
-        ax.set_xticks(np.arange(x_min, x_max, 5))
+        ax.plot([], [], color='#49CED4', lw=2, label='ДН адаптивной АФАР')
+        ax.plot([], [], 'ro')
+        ax.plot([], [], color='#9EC567', ls='--', lw=1.2, label='ДН обычной АФАР')
+        ax.set_xlim(cls.x_min, cls.x_max)
+        ax.set_xticks(np.arange(cls.x_min, cls.x_max, 5))
         ax.grid(True)
         ax.set_xlabel('θ,°')
-        return ax, fig
+        return fig
+
+    def base_image(self, y_min):
+        self.fig = figures.get('diagram', self.create_figure)
+        ax = self.fig.axes[0]
+        line = ax.lines[0]
+        line.set_data(self._model.theta_deg, self._figure)
+        ax.set_ylim(y_min, 0)
+        ax.set_yticks(np.arange(y_min, 0, int(abs(y_min) / LUCKY_NUMBER)))
+        return ax, self.fig
 
     @binary_saver
     def get_image(self):
@@ -64,17 +111,30 @@ class DiagramImage(AbstractImage):
         if self._base_figure is not None:
             y_min = self.y_min_calc()
 
-        ax, self.fig = self.base_image(y_min)
+        ax, _ = self.base_image(y_min)
+        line, markers, base_line = ax.lines[:3]
 
         if self._base_figure is not None:
-            for ind in self._model.cl_index:
-                ax.plot(self._model.theta_deg[ind], self._figure[ind], 'ro')
+            cl_index = self._model.cl_index
+            markers.set_data(self._model.theta_deg[cl_index], self._figure[cl_index])
+            for ind in cl_index:
                 ax.arrow(self._model.theta_deg[ind], 0, 0.0, -4, fc="k", ec="k",
                          head_width=1, head_length=3.2)
 
-            ax.plot(self._model.theta_deg, self._base_figure, color='#9EC567',
-                    ls='--', lw=1.2, label='ДН обычной АФАР')
-            ax.legend(loc='lower right', fancybox=True, framealpha=0.5, fontsize='large')
+            base_line.set_data(self._model.theta_deg, self._base_figure)
+            ax.legend(handles=[line, base_line], loc='lower right', fancybox=True, framealpha=0.5,
+                      fontsize='large')
+
+    def release(self):
+        if self.fig is None:
+            return
+        ax = self.fig.axes[0]
+        for line in ax.lines:
+            line.set_data([], [])
+        for patch in list(ax.patches):
+            patch.remove()
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
 
     def y_min_calc(self):
         min_value = np.min(self._figure[self._model.cl_index]) - LUCKY_NUMBER
@@ -91,30 +151,265 @@ class ClutterImage(AbstractImage):
 
     @binary_saver
     def get_image(self):
-        self.fig = plt.figure(figsize=(7, 7))
+        self.fig = figures.get('clutter', lambda: new_figure(figsize=(7, 7)))
 
         amount = len(self._model.cl_index)
+        if len(self.fig.axes) != amount:
+            # the layout depends on the number of interferences, rebuilt only when it changes
+            self.fig.clear()
+            nrows = 2 if amount <= 4 else int(np.ceil(amount / 2))
+            for i in range(amount):
+                ax = self.fig.add_subplot(nrows, 2, i + 1)
+                ax.plot([], [])
+                ax.grid(True)
 
-        for i in range(amount):
-            nrows = 2 if amount <= 4 else np.ceil(amount / 2)
-            ax = self.fig.add_subplot(nrows, 2, i + 1)
+        for i, ax in enumerate(self.fig.axes):
+            ax.lines[0].set_data(self._model.ph, np.real(self._model.interferences[:, i]))
+            ax.relim()
+            ax.autoscale_view()
 
-            ax.plot(self._model.ph, np.real(self._model.interferences[:, i]))
-            ax.grid(True)
+    def release(self):
+        if self.fig is None:
+            return
+        for ax in self.fig.axes:
+            ax.lines[0].set_data([], [])
 
 
 class ScatterImage(AbstractImage):
-    def __init__(self, model):
+    """
+    Pairwise densities of the clatter at the given elements (by default up to nine
+    around the array centre): 2-D histograms off the diagonal and 1-D histograms on it,
+    drawn as a single image instead of a matrix of point clouds
+    """
+    bins = 32
+
+    def __init__(self, model, elements=None):
         super().__init__(model)
+        if elements is None:
+            center = model.N // 2
+            elements = np.arange(max(center - 4, 0), min(center + 5, model.N))
+        self._elements = np.asarray(elements)
+
+    @staticmethod
+    def create_figure():
+        fig = new_figure(figsize=(8, 8))
+        ax = fig.add_subplot(1, 1, 1)
+        ax.imshow(np.ma.masked_all((1, 1)), origin='lower', cmap='Blues', vmin=0, vmax=1,
+                  interpolation='nearest')
+        ax.plot([], [], color='#49CED4', lw=1.2)
+        ax.tick_params(which='minor', length=0)
+        return fig
+
+    def histograms(self):
+        """
+        All 1-D and 2-D histograms of the real parts in one pass: (k, bins) and (k, k, bins, bins)
+        """
+
+        samples = np.real(self._model.clatter[:, self._elements])
+        low = samples.min(axis=0)
+        span = samples.max(axis=0) - low
+        span[span == 0] = 1
+        codes = np.clip(((samples - low) / span * self.bins).astype(int), 0, self.bins - 1)
+
+        k = codes.shape[1]
+        pairs = np.arange(k * k).reshape(k, k)
+        flat = pairs[None] * self.bins ** 2 + codes[:, :, None] * self.bins + codes[:, None, :]
+        joint = np.bincount(flat.ravel(), minlength=k * k * self.bins ** 2).reshape(k, k, self.bins, self.bins)
+        marginal = joint[np.arange(k), np.arange(k)].sum(axis=2)
+        return marginal, joint
 
     @binary_saver
     def get_image(self):
-        self.fig = plt.figure(figsize=(8, 8))
-        ax = self.fig.add_subplot(1, 1, 1)
-        radiators = pd.DataFrame(np.real(self._model.clatter[:, 5:14]),
-                                 columns=['-4', '-3', '-2', '-1', '0', '1', '2', '3', '4'])
+        self.fig = figures.get('scatter', self.create_figure)
+        ax = self.fig.axes[0]
+        mesh = ax.images[0]
+        line = ax.lines[0]
+        marginal, joint = self.histograms()
+        k, bins = len(self._elements), self.bins
+
+        # block (row, col): x is the element of col, y the element of row, first element on top;
+        # joint[row, col, y, x] sits at rows (k - 1 - row) * bins + y
+        density = np.log1p(joint)
+        density = density / np.maximum(density.max(axis=(2, 3), keepdims=True), 1)
+        mosaic = density[::-1].transpose(0, 2, 1, 3).reshape(k * bins, k * bins)
+        diagonal = np.kron(np.eye(k)[::-1], np.ones((bins, bins))).astype(bool)
+        mesh.set_data(np.ma.masked_array(mosaic, diagonal))
+        mesh.set_extent((0, k * bins, 0, k * bins))
+
+        steps = np.arange(bins + 1)
+        x, y = list(), list()
+        for i in range(k):
+            level = 0.9 * bins * np.append(marginal[i], marginal[i][-1]) / max(marginal[i].max(), 1)
+            x.append(np.append(i * bins + steps, np.nan))
+            y.append(np.append((k - 1 - i) * bins + level, np.nan))
+        line.set_data(np.concatenate(x), np.concatenate(y))
+        line.set_drawstyle('steps-post')
+
+        labels = [str(element - self._model.N // 2) for element in self._elements]
+        centers = bins * np.arange(k) + bins / 2
+        ax.set_xticks(centers)
+        ax.set_xticklabels(labels)
+        ax.set_yticks(centers)
+        ax.set_yticklabels(labels[::-1])
+        ax.set_xticks(bins * np.arange(k + 1), minor=True)
+        ax.set_yticks(bins * np.arange(k + 1), minor=True)
+        ax.grid(True, which='minor', color='k', lw=0.5)
+        ax.set_xlim(0, k * bins)
+        ax.set_ylim(0, k * bins)
+
+    def release(self):
+        if self.fig is None:
+            return
+        ax = self.fig.axes[0]
+        ax.images[0].set_data(np.ma.masked_all((1, 1)))
+        ax.lines[0].set_data([], [])
 
-        scatter_matrix(radiators, alpha=0.5, grid=True, diagonal='kde', ax=ax)
 
+class SweepImage(AbstractImage):
+    x_min = -60
+    x_max = 60
+    y_min = -LUCKY_NUMBER * 2
+
+    def __init__(self, model, diagrams, scans):
+        super().__init__(model)
+        self._figures = diagrams
+        self._scans = scans
+
+    @classmethod
+    def create_figure(cls):
+        fig = new_figure(figsize=(10, 6))
+        ax = fig.add_subplot(1, 1, 1)
+        mesh = ax.imshow(np.zeros((1, 1)), origin='lower', aspect='auto', vmin=cls.y_min, vmax=0,
+                         cmap='viridis')
+        ax.set_xlabel('θ,°')
+        ax.set_ylabel('Направление сканирования,°')
+        fig.colorbar(mesh, ax=ax, label='дБ')
+        return fig
+
+    @binary_saver
+    def get_image(self):
+        self.fig = figures.get('sweep', self.create_figure)
+        ax = self.fig.axes[0]
+        mesh = ax.images[0]
+
+        # resampled on a uniform 0.1° grid, so rendering does not depend on resolution
+        theta_deg = np.linspace(self.x_min, self.x_max, 10 * (self.x_max - self.x_min) + 1)
+        sweep = np.array([np.interp(theta_deg, self._model.theta_deg, figure) for figure in self._figures])
+        step = (self._scans[-1] - self._scans[0]) / max(len(self._scans) - 1, 1) / 2 or 0.5
+        extent = (self.x_min, self.x_max, self._scans[0] - step, self._scans[-1] + step)
+        mesh.set_data(sweep)
+        mesh.set_extent(extent)
+        for ind in getattr(self._model, 'cl_index', []):
+            ax.axvline(self._model.theta_deg[ind], color='r', ls='--', lw=1)
+
+        ax.set_xlim(self.x_min, self.x_max)
+        ax.set_ylim(extent[2], extent[3])
+        ax.set_xticks(np.arange(self.x_min, self.x_max, 5))
+
+    def release(self):
+        if self.fig is None:
+            return
+        ax = self.fig.axes[0]
+        ax.images[0].set_data(np.zeros((1, 1)))
+        for line in list(ax.lines):
+            line.remove()
+
+
+class ConvergenceImage(AbstractImage):
+    def __init__(self, model, counts, depths):
+        super().__init__(model)
+        self._counts = counts
+        self._depths = depths
+
+    @staticmethod
+    def create_figure():
+        fig = new_figure(figsize=(8, 5))
+        ax = fig.add_subplot(1, 1, 1)
+        ax.set_xscale('log')
+        ax.grid(True, which='both')
+        ax.set_xlabel('Число отсчетов')
+        ax.set_ylabel('Подавление, дБ')
+        return fig
+
+    @binary_saver
+    def get_image(self):
+        self.fig = figures.get('convergence', self.create_figure)
+        ax = self.fig.axes[0]
+        ax.set_prop_cycle(None)
+        for depth, ind in zip(self._depths.T, self._model.cl_index):
+            ax.plot(self._counts, depth, lw=1.2, label=f'{round(self._model.theta_deg[ind], 2)}°')
+        ax.set_xlim(self._counts[0], max(self._counts[-1], self._counts[0] + 1))
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        ax.legend(loc='upper right', fancybox=True, framealpha=0.5)
+
+    def release(self):
+        if self.fig is None:
+            return
+        ax = self.fig.axes[0]
+        for line in list(ax.lines):
+            line.remove()
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+
+
+class PlanarImage(AbstractImage):
+    """
+    Pattern of a planar array over the direction cosines and its cuts in the planes phis
+    """
+    x_min = -90
+    x_max = 90
+    y_min = -LUCKY_NUMBER * 2
+
+    def __init__(self, model, u, v, pattern, phis, cuts):
+        super().__init__(model)
+        self._u = u
+        self._v = v
+        self._pattern = pattern
+        self._phis = phis
+        self._cuts = cuts
+
+    @classmethod
+    def create_figure(cls):
+        fig = new_figure(figsize=(14, 6))
+        ax_map, ax_cuts = fig.subplots(1, 2, gridspec_kw={'width_ratios': [1, 1.3]})
+        mesh = ax_map.imshow(np.ma.masked_all((1, 1)), origin='lower', extent=(-1, 1, -1, 1),
+                             vmin=cls.y_min, vmax=0, cmap='viridis')
+        ax_map.set_xlabel('u = sin θ cos φ')
+        ax_map.set_ylabel('v = sin θ sin φ')
+        fig.colorbar(mesh, ax=ax_map, label='дБ', fraction=0.046, pad=0.04)
+        ax_cuts.set_xlim(cls.x_min, cls.x_max)
+        ax_cuts.set_ylim(cls.y_min, 0)
+        ax_cuts.set_xticks(np.arange(cls.x_min, cls.x_max + 1, 15))
+        ax_cuts.grid(True)
+        ax_cuts.set_xlabel('θ,°')
+        return fig
+
+    @binary_saver
+    def get_image(self):
+        self.fig = figures.get('planar', self.create_figure)
+        ax_map, ax_cuts = self.fig.axes[:2]
+        mesh = ax_map.images[0]
+        mesh.set_data(np.ma.masked_invalid(self._pattern))
+        mesh.set_extent((self._u[0], self._u[-1], self._v[0], self._v[-1]))
+
+        # the plane of the scan and the scan direction
+        phi = self._model.phi
+        ax_map.plot([-np.cos(phi), np.cos(phi)], [-np.sin(phi), np.sin(phi)], color='w', ls='--', lw=1)
+        scan = np.sin(self._model.theta[self._model.scan_ind[0]])
+        ax_map.plot(scan * np.cos(phi), scan * np.sin(phi), 'r+', ms=10)
 
+        ax_cuts.set_prop_cycle(None)
+        for phi, cut in zip(self._phis, self._cuts):
+            ax_cuts.plot(self._model.theta_deg, cut, lw=1.5, label=f'φ = {round(phi, 1)}°')
+        ax_cuts.legend(loc='lower right', fancybox=True, framealpha=0.5)
 
+    def release(self):
+        if self.fig is None:
+            return
+        for ax in self.fig.axes[:2]:
+            for line in list(ax.lines):
+                line.remove()
+        self.fig.axes[0].images[0].set_data(np.ma.masked_all((1, 1)))
+        if self.fig.axes[1].get_legend() is not None:
+            self.fig.axes[1].get_legend().remove()
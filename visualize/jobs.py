@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from threading import Event, Thread
+from django.conf import settings
+
+from .core import create_antenna, sweep_antenna
+from .storage import results, jobs, metrics
+from .timing import Timings, collect
+
+STAGES = {
+    'queued': 'В очереди',
+    'base': 'Расчёт обычной АФАР',
+    'errors': 'Генерация ошибок',
+    'model': 'Построение модели',
+    'iterations': 'Итерации управляемых связей',
+    'diagram': 'Расчёт диаграммы направленности',
+    'planar': 'Расчёт двумерной ДН',
+    'sweep': 'Расчёт диаграммы сканирования',
+    'convergence': 'Рекуррентная оценка весов',
+    'images': 'Построение графиков',
+    'done': 'Готово',
+    'failed': 'Ошибка расчёта'
+}
+
+
+def run_job(queue, key, antenna_type, antenna_params, scans=None):
+    """
+    Computes the design, or its scan sweep if scans are given, into results[key]
+    """
+
+    queue.update(key, state='running')
+
+    def progress(stage, **info):
+        queue.update(key, stage=stage, **info)
+
+    try:
+        with collect(Timings() if settings.STAGE_TIMING else None) as timings:
+            if scans is None:
+                result = create_antenna(antenna_params, antenna_type, progress=progress).get_result()
+            else:
+                result = sweep_antenna(antenna_params, antenna_type, scans, progress=progress).get_result()
+    except Exception as error:
+        queue.update(key, state='failed', stage='failed', error=str(error))
+        return
+    if timings is not None:
+        result['timings'] = timings.stages
+        metrics.observe(timings.stages)
+    results.set(key, result)
+    queue.update(key, state='done', stage='done')
+
+
+@contextmanager
+def heartbeat(queue, key, interval=10):
+    """
+    Keeps the job alive in its status while a long stage reports no progress
+    """
+
+    stop = Event()
+
+    def beat():
+        while not stop.wait(interval):
+            queue.update(key)
+
+    thread = Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def work(queue=jobs):
+    worker = queue.worker_id()
+    while True:
+        job = queue.next(worker)
+        with heartbeat(queue, job[0]):
+            run_job(queue, *job)
+        queue.finish(worker)
@@ -0,0 +1,38 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from visualize import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Times the antenna models and renderers and compares them with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', help='shell patterns of case names, all by default')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='JSON file for the results')
+        parser.add_argument('--baseline', help='JSON file of earlier results to compare with')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='relative growth of the median time or peak memory reported as a regression')
+        parser.add_argument('--list', action='store_true', help='only list the cases')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            self.stdout.write('\n'.join(benchmarks.CASES))
+            return
+
+        def report(name, result):
+            self.stdout.write(f'{name:<50} {result["median"] * 1000:10.2f} ms {result["peak_mb"]:8.2f} MB')
+
+        results = benchmarks.run(options['cases'], options['repeat'], report)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = benchmarks.compare(results, json.load(baseline), options['threshold'])
+            for name, metric, ratio in regressions:
+                self.stderr.write(f'{name}: {metric} x{ratio:.2f}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions over {options["threshold"]:.0%}')
@@ -0,0 +1,37 @@
+from multiprocessing import Process
+from multiprocessing.connection import wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from visualize.jobs import work
+from visualize.storage import jobs
+from visualize.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = 'Runs a bounded pool of simulation workers consuming the Redis job queue, ' \
+           'a worker that dies is replaced and its job is put back into the queue once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS)
+
+    @staticmethod
+    def start_worker():
+        worker = Process(target=work, daemon=True)
+        worker.start()
+        return worker
+
+    def handle(self, *args, **options):
+        if settings.WARMUP:
+            warmup(settings.MODEL_PRECISION)
+        workers = [self.start_worker() for _ in range(options['workers'])]
+        self.stdout.write(f'Started {len(workers)} workers')
+        while True:
+            wait([worker.sentinel for worker in workers])
+            for position, worker in enumerate(workers):
+                if worker.is_alive():
+                    continue
+                requeued, failed = jobs.requeue(jobs.worker_id(worker.pid))
+                workers[position] = self.start_worker()
+                self.stderr.write(f'Worker {worker.pid} exited with code {worker.exitcode}, {requeued} job(s) '
+                                  f'requeued, {failed} failed, started worker {workers[position].pid}')
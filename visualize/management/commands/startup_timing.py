@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+from django.core.management.base import BaseCommand
+
+# run in a fresh interpreter, so that nothing is imported in advance
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import antennapp.wsgi
+loaded = time.perf_counter()
+from visualize.core import create_antenna
+params = dict(n_array=29, scan=0, random_state=42, a_sigma=0.1, ph_sigma=5, ph_interference=[20, -30],
+              a=1, a_rand=0.01, ph_rand=0.5, iteration=5, boresight_err='no_err')
+timings = {'import': loaded - start}
+for name in ('first_request', 'second_request'):
+    begin = time.perf_counter()
+    create_antenna(dict(params), 'controlled_connections').get_result()
+    timings[name] = time.perf_counter() - begin
+print(json.dumps(timings))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measures worker start-up time and first request latency with and without warmup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for warmup in ('0', '1'):
+            env = dict(os.environ, WARMUP=warmup)
+            env.setdefault('DJANGO_SETTINGS_MODULE', 'antennapp.settings')
+            runs = [json.loads(subprocess.check_output([sys.executable, '-c', PROBE], env=env).decode().splitlines()[-1])
+                    for _ in range(options['repeat'])]
+            timings = ', '.join(f'{name} {median(run[name] for run in runs) * 1000:.0f} ms' for name in runs[0])
+            self.stdout.write(f'WARMUP={warmup}: {timings}')
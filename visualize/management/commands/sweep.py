@@ -0,0 +1,55 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from visualize.parameter_sweep import ParameterSweep
+from visualize.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = 'Runs the cartesian product of parameter ranges of a design across a process pool, ' \
+           'an interrupted sweep resumes into the same output'
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', help='JSON file: {"antenna_type": ..., "params": {...}, "sweep": '
+                                         '{"name": [values] or {"start", "stop", "step" or "num"}}}')
+        parser.add_argument('--output', required=True, help='directory of the results')
+        parser.add_argument('--workers', type=int, help='processes, all cores by default')
+        parser.add_argument('--chunk-size', type=int, default=25)
+        parser.add_argument('--points', type=int, default=10000, help='samples of the stored patterns')
+        parser.add_argument('--every', type=float, default=10, help='seconds between progress reports')
+
+    def handle(self, *args, **options):
+        with open(options['spec']) as spec:
+            spec = json.load(spec)
+        sweep = ParameterSweep(spec, options['output'], points=options['points'], workers=options['workers'],
+                               chunk_size=options['chunk_size'])
+        try:
+            left = sweep.open()
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(f'{sweep.size} configurations, {left} left')
+        if not left:
+            return
+
+        if settings.WARMUP:
+            warmup(settings.MODEL_PRECISION)
+        start = reported = time.perf_counter()
+        done_before = sweep.size - left
+        done = failed = 0
+        try:
+            for done, failed in sweep.run():
+                now = time.perf_counter()
+                if now - reported < options['every']:
+                    continue
+                reported = now
+                rate = (done + failed - done_before) / (now - start)
+                eta = (sweep.size - done - failed) / rate if rate else float('inf')
+                self.stdout.write(f'{done + failed}/{sweep.size} done, {failed} failed, '
+                                  f'{rate:.1f} per second, {eta / 60:.0f} min left')
+        except KeyboardInterrupt:
+            self.stdout.write(f'Interrupted after {done + failed}/{sweep.size}, '
+                              f'run the same command to resume')
+            return
+        self.stdout.write(f'Finished: {done} done, {failed} failed in {time.perf_counter() - start:.0f} s')
@@ -0,0 +1,91 @@
+from multiprocessing import Pool
+import numpy as np
+
+from .core import create_antenna
+
+
+def realize(antenna_params, antenna_type, seeds):
+    """
+    Metrics of one design per seed: main lobe width, peak sidelobe level
+    and absolute suppression of every interference
+    """
+
+    metrics = list()
+    for seed in seeds:
+        params = dict(antenna_params)
+        # the clatter of an adaptive antenna is seeded by random_state
+        params['random_state'] = int(seed.generate_state(1)[0])
+        design = create_antenna(params, antenna_type, image_required=False, seed=seed)
+        row = [design.main_lobe, design.sidelobe_calc()]
+        if hasattr(design.antenna, 'cl_index'):
+            row += list(design.diagram[design.antenna.cl_index])
+        metrics.append(row)
+    return np.array(metrics)
+
+
+def _realize_chunk(task):
+    start, antenna_params, antenna_type, seeds = task
+    return start, realize(antenna_params, antenna_type, seeds)
+
+
+class MonteCarlo:
+    """
+    Error statistics over many independent realizations of a design.
+    Realization i always draws from the i-th child of SeedSequence(master_seed),
+    so the results depend only on the master seed, not on the number of workers
+    """
+    percentiles = (5, 50, 95)
+    bins = 20
+
+    def __init__(self, antenna_params, antenna_type, realizations=1000, master_seed=0,
+                 workers=None, chunk_size=25):
+        self.antenna_params = antenna_params
+        self.antenna_type = antenna_type
+        self.realizations = int(realizations)
+        self.master_seed = master_seed
+        self.workers = workers
+        self.chunk_size = int(chunk_size)
+
+        self.columns = ['main_lobe', 'sidelobe']
+        if antenna_type != 'antenna':
+            self.columns += [f'suppression_{angle}' for angle in antenna_params['ph_interference']]
+        self.values = np.full((self.realizations, len(self.columns)), np.nan)
+        self.done = np.zeros(self.realizations, bool)
+
+    def tasks(self):
+        seeds = np.random.SeedSequence(self.master_seed).spawn(self.realizations)
+        for start in range(0, self.realizations, self.chunk_size):
+            yield start, self.antenna_params, self.antenna_type, seeds[start: start + self.chunk_size]
+
+    def run(self):
+        """
+        Yields the aggregate over the realizations completed so far after every chunk
+        """
+
+        with Pool(self.workers) as pool:
+            for start, metrics in pool.imap_unordered(_realize_chunk, self.tasks()):
+                self.values[start: start + len(metrics)] = metrics
+                self.done[start: start + len(metrics)] = True
+                yield self.aggregate()
+
+    def aggregate(self):
+        values = self.values[self.done]
+        summary = {'realizations': len(values)}
+        for column, samples in zip(self.columns, values.T):
+            samples = samples[np.isfinite(samples)]
+            if not len(samples):
+                continue
+            counts, edges = np.histogram(samples, bins=self.bins)
+            summary[column] = {
+                'mean': np.mean(samples),
+                'std': np.std(samples),
+                'percentiles': dict(zip(self.percentiles, np.percentile(samples, self.percentiles))),
+                'histogram': (counts, edges)
+            }
+        return summary
+
+    def summary(self):
+        aggregate = None
+        for aggregate in self.run():
+            pass
+        return aggregate
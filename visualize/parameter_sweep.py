@@ -0,0 +1,180 @@
+import json
+import os
+import time
+from multiprocessing import Pool
+from numbers import Number
+import numpy as np
+
+from .core import create_antenna
+from .decimation import FLOOR_DB
+
+PENDING, DONE, FAILED = 0, 1, 2
+
+
+def expand(values):
+    """
+    Values of a swept parameter: a list as is, {start, stop, step} (stop included)
+    or {start, stop, num} evenly spaced
+    """
+
+    if isinstance(values, dict):
+        if 'num' in values:
+            return np.linspace(values['start'], values['stop'], int(values['num'])).tolist()
+        step = values.get('step', 1)
+        values_range = np.arange(values['start'], values['stop'] + step / 2, step)
+        # integer ranges stay integer: n_array, iteration, random_state
+        if all(isinstance(values.get(key, 1), int) for key in ('start', 'stop', 'step')):
+            values_range = values_range.astype(int)
+        return values_range.tolist()
+    return list(values)
+
+
+def realize(spec, indices, theta_deg):
+    """
+    Patterns on theta_deg (dB, float32) and metric rows of the configurations at indices
+    """
+
+    sweep = ParameterSweep(spec, None)
+    patterns = np.full((len(indices), len(theta_deg)), np.nan, np.float32)
+    metrics = np.full((len(indices), len(sweep.metric_columns)), np.nan)
+    status = np.full(len(indices), DONE, np.int8)
+    for row, index in enumerate(indices):
+        start = time.perf_counter()
+        try:
+            design = create_antenna(sweep.configuration(index), sweep.antenna_type, image_required=False)
+        except Exception:
+            status[row] = FAILED
+            continue
+        diagram = np.maximum(design.diagram, FLOOR_DB)
+        patterns[row] = np.interp(theta_deg, design.antenna.theta_deg, diagram)
+        values = [design.metrics[name] for name in ('beamwidth', 'null_width', 'sidelobe_peak', 'sidelobe_mean')]
+        if 'suppression_mean' in sweep.metric_columns:
+            cl_index = design.antenna.cl_index
+            values += [20 * np.log10(np.mean(design.diagram_in_times[cl_index])), np.max(diagram[cl_index])]
+        metrics[row] = values + [time.perf_counter() - start]
+    return indices, patterns, metrics, status
+
+
+def _realize_chunk(task):
+    return realize(*task)
+
+
+class ParameterSweep:
+    """
+    Cartesian product of parameter ranges run without images across a process pool.
+    Configuration i is the i-th combination in the order of the spec, so results
+    land in fixed rows of the output directory:
+        spec.json - the spec, a sweep resumes only into the output of the same one
+        theta_deg.npy - angles of the stored patterns
+        patterns.npy - configurations x theta_deg, dB, memory-mapped
+        columns/<name>.npy - one memory-mapped array per metric and swept parameter,
+            parameters that are not numbers are stored as indices into their values
+        columns/status.npy - 0 pending, 1 done, 2 failed
+    The parent process is the only writer, a row is marked done after its data is flushed
+    """
+    metric_names = ['main_lobe', 'null_width', 'sidelobe_peak', 'sidelobe_mean']
+
+    def __init__(self, spec, output, points=10000, workers=None, chunk_size=25):
+        self.spec = spec
+        self.antenna_type = spec['antenna_type']
+        self.params = spec.get('params', dict())
+        self.names = list(spec['sweep'])
+        self.values = [expand(spec['sweep'][name]) for name in self.names]
+        self.shape = tuple(len(values) for values in self.values)
+        self.size = int(np.prod(self.shape))
+        self.output = output
+        self.points = int(points)
+        self.workers = workers
+        self.chunk_size = int(chunk_size)
+
+        self.metric_columns = list(self.metric_names)
+        if self.antenna_type != 'antenna':
+            self.metric_columns += ['suppression_mean', 'suppression_worst']
+        self.metric_columns.append('seconds')
+
+    def configuration(self, index):
+        params = dict(self.params)
+        for name, values, position in zip(self.names, self.values, np.unravel_index(index, self.shape)):
+            params[name] = values[position]
+        return params
+
+    def parameter_columns(self):
+        """
+        Name and values of the column of every swept parameter
+        """
+
+        grid = np.indices(self.shape).reshape(len(self.shape), -1)
+        for name, values, positions in zip(self.names, self.values, grid):
+            if all(isinstance(value, Number) for value in values):
+                yield name, np.asarray(values, float)[positions]
+            else:
+                yield f'{name}_index', positions
+
+    def path(self, *parts):
+        return os.path.join(self.output, *parts)
+
+    def open(self):
+        """
+        Creates the output or reopens it to resume, returns the number of rows left
+        """
+
+        stored = dict(self.spec, points=self.points)
+        if os.path.exists(self.path('spec.json')):
+            with open(self.path('spec.json')) as previous:
+                if json.load(previous) != json.loads(json.dumps(stored)):
+                    raise ValueError(f'{self.output} holds another sweep')
+            mode = 'r+'
+        else:
+            os.makedirs(self.path('columns'), exist_ok=True)
+            np.save(self.path('theta_deg.npy'), np.linspace(-90, 90, self.points))
+            mode = 'w+'
+
+        def column(name, dtype, shape=(self.size,)):
+            return np.lib.format.open_memmap(self.path(name), mode=mode, dtype=dtype, shape=shape)
+
+        self.theta_deg = np.load(self.path('theta_deg.npy'))
+        self.patterns = column('patterns.npy', np.float32, (self.size, self.points))
+        self.metrics = {name: column(os.path.join('columns', f'{name}.npy'), float) for name in self.metric_columns}
+        self.status = column(os.path.join('columns', 'status.npy'), np.int8)
+        if mode == 'w+':
+            for name, values in self.parameter_columns():
+                column(os.path.join('columns', f'{name}.npy'), values.dtype)[:] = values
+            # written last: a sweep interrupted while creating its output starts over
+            with open(self.path('spec.json'), 'w') as spec:
+                json.dump(stored, spec, indent=2)
+        return int(np.count_nonzero(self.status == PENDING))
+
+    def tasks(self):
+        pending = np.flatnonzero(self.status == PENDING)
+        for start in range(0, len(pending), self.chunk_size):
+            yield self.spec, pending[start: start + self.chunk_size], self.theta_deg
+
+    def run(self):
+        """
+        Yields the numbers of rows done and failed after every completed chunk
+        """
+
+        with Pool(self.workers) as pool:
+            for indices, patterns, metrics, status in pool.imap_unordered(_realize_chunk, self.tasks()):
+                self.patterns[indices] = patterns
+                for name, values in zip(self.metric_columns, metrics.T):
+                    self.metrics[name][indices] = values
+                self.patterns.flush()
+                for values in self.metrics.values():
+                    values.flush()
+                self.status[indices] = status
+                self.status.flush()
+                yield int(np.count_nonzero(self.status == DONE)), int(np.count_nonzero(self.status == FAILED))
+
+
+def load(output):
+    """
+    Spec, angles, patterns (memory-mapped read-only) and columns of a sweep output
+    """
+
+    with open(os.path.join(output, 'spec.json')) as spec:
+        spec = json.load(spec)
+    columns = {name[:-len('.npy')]: np.load(os.path.join(output, 'columns', name), mmap_mode='r')
+               for name in sorted(os.listdir(os.path.join(output, 'columns'))) if name.endswith('.npy')}
+    return (spec, np.load(os.path.join(output, 'theta_deg.npy')),
+            np.load(os.path.join(output, 'patterns.npy'), mmap_mode='r'), columns)
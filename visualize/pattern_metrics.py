@@ -0,0 +1,69 @@
+import numpy as np
+
+from .decimation import FLOOR_DB
+
+
+def pattern_metrics(theta_deg, diagram, scan_ind, cl_index=()):
+    """
+    Metrics of a pattern in dB on any (also non-uniform) grid of angles theta_deg.
+    The main lobe is the interval between the local minima (first nulls) around scan_ind
+    that lie below its -3 dB level, shallower ripples belong to the lobe.
+    Levels are relative to the main lobe peak, widths are in degrees:
+    beamwidth - between the -3 dB crossings interpolated linearly in dB, twice the half-width
+        on the other side if one side of the lobe reaches the end of the grid above -3 dB,
+    null_width - between the first nulls,
+    sidelobe_peak, sidelobe_mean - the highest and the power-averaged level beyond the first nulls,
+    null_depths - levels at cl_index
+    """
+
+    theta_deg = np.asarray(theta_deg, float)
+    diagram = np.maximum(np.asarray(diagram, float), FLOOR_DB)
+    n = len(diagram)
+
+    inner = np.flatnonzero((diagram[1:-1] < diagram[:-2]) & (diagram[1:-1] <= diagram[2:])) + 1
+    minima = np.concatenate([[0], inner, [n - 1]])
+    right = min(np.searchsorted(minima, scan_ind, side='right'), len(minima) - 1)
+    left_null, right_null = minima[right - 1], minima[right]
+    while True:
+        peak = left_null + np.argmax(diagram[left_null: right_null + 1])
+        level = diagram[peak] - 3
+        # the peak never falls from one pass to the next, so the nulls settle
+        edges = inner[diagram[inner] < level]
+        nulls = np.max(edges[edges < peak], initial=0), np.min(edges[edges > peak], initial=n - 1)
+        if nulls == (left_null, right_null):
+            break
+        left_null, right_null = nulls
+
+    def crossing(i, j):
+        return theta_deg[i] + (level - diagram[i]) / (diagram[j] - diagram[i]) * (theta_deg[j] - theta_deg[i])
+
+    below_left = np.flatnonzero(diagram[left_null: peak + 1] < level)
+    below_right = np.flatnonzero(diagram[peak: right_null + 1] < level)
+    left = crossing(left_null + below_left[-1], left_null + below_left[-1] + 1) if len(below_left) else np.nan
+    right = crossing(peak + below_right[0], peak + below_right[0] - 1) if len(below_right) else np.nan
+    if np.isnan(left) != np.isnan(right):
+        # the lobe leaves the visible region on one side
+        beamwidth = 2 * np.nanmax([theta_deg[peak] - left, right - theta_deg[peak]])
+    else:
+        beamwidth = right - left
+
+    sidelobes = np.ones(n, bool)
+    sidelobes[left_null: right_null + 1] = False
+    if sidelobes.any():
+        weights = np.gradient(theta_deg)[sidelobes] if n > 1 else np.ones(1)
+        power = 10 ** (diagram[sidelobes] / 10)
+        sidelobe_peak = np.max(diagram[sidelobes]) - diagram[peak]
+        sidelobe_mean = 10 * np.log10(np.sum(power * weights) / np.sum(weights)) - diagram[peak]
+    else:
+        sidelobe_peak = sidelobe_mean = -np.inf
+
+    return {
+        'peak': peak,
+        'crossings': (left, right),
+        'beamwidth': beamwidth,
+        'first_nulls': (left_null, right_null),
+        'null_width': theta_deg[right_null] - theta_deg[left_null],
+        'sidelobe_peak': sidelobe_peak,
+        'sidelobe_mean': sidelobe_mean,
+        'null_depths': diagram[np.asarray(cl_index, int)] - diagram[peak]
+    }
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class SteeringCache:
+    """
+    Process-wide LRU cache of read-only steering matrices
+    bounded by the total size of the stored arrays
+    """
+    max_bytes = 256 * 2**20
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._matrices = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, key, factory):
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is not None:
+                self._matrices.move_to_end(key)
+                self.hits += 1
+                return matrix
+            self.misses += 1
+
+        matrix = factory()
+        matrix.flags.writeable = False
+        if matrix.nbytes > self.max_bytes:
+            return matrix
+
+        with self._lock:
+            if key not in self._matrices:
+                self._matrices[key] = matrix
+                self._bytes += matrix.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._matrices.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return matrix
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._matrices),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes
+        }
+
+
+steering_cache = SteeringCache()
@@ -1,3 +1,10 @@
+import json
+import os
+import pickle
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 import redis
 from django.conf import settings
 
@@ -17,4 +24,237 @@ class Storage:
         return self.conn.get(key)
 
 
-cache = Storage()
+class ResultCache(Storage):
+    """
+    Computed results addressed by the hash of their parameters.
+    Entries live session_time seconds and the least recently used ones
+    are evicted once their total size exceeds max_bytes
+    """
+    session_time = 24 * 3600
+    max_bytes = 256 * 2**20
+    prefix = 'result:'
+    index = 'result-index'
+    sizes = 'result-sizes'
+    total = 'result-bytes'
+
+    def set(self, key, value):
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        key = self.prefix + key
+        pipe = self.conn.pipeline()
+        pipe.set(key, value, ex=self.session_time)
+        pipe.zadd(self.index, {key: time.time()})
+        pipe.hget(self.sizes, key)
+        pipe.hset(self.sizes, key, len(value))
+        previous = pipe.execute()[2]
+        self.conn.incrby(self.total, len(value) - int(previous or 0))
+        self.evict()
+
+    def get(self, key):
+        value = self.conn.get(self.prefix + key)
+        if value is None:
+            return None
+        self.conn.zadd(self.index, {self.prefix + key: time.time()})
+        return pickle.loads(value)
+
+    def __contains__(self, key):
+        return bool(self.conn.exists(self.prefix + key))
+
+    def evict(self):
+        while int(self.conn.get(self.total) or 0) > self.max_bytes:
+            oldest = self.conn.zrange(self.index, 0, 0)
+            if not oldest:
+                self.conn.set(self.total, 0)
+                break
+            key = oldest[0]
+            pipe = self.conn.pipeline()
+            pipe.hget(self.sizes, key)
+            pipe.delete(key)
+            pipe.zrem(self.index, key)
+            pipe.hdel(self.sizes, key)
+            size = pipe.execute()[0]
+            self.conn.decrby(self.total, int(size or 0))
+
+
+class JobQueue(Storage):
+    """
+    Simulation jobs in a Redis list, consumed by `manage.py run_workers`.
+    A job is a design key, its status is a hash of state, stage, iteration count, attempts and
+    the time of the last heartbeat. A worker moves the job it takes to its own
+    processing list, so the job of a worker that died can be put back into the queue
+    """
+    session_time = 3600
+    queue = 'jobs'
+    prefix = 'job:'
+    processing = 'jobs-processing:'
+    # a running job that has not reported for this long is taken for lost
+    stale_after = 60
+    # a job lost this many times (its worker died) fails instead of running again
+    max_attempts = 2
+    lost_error = 'Расчёт прерван: обработчик завершился аварийно, возможно, модели не хватило памяти'
+
+    def enqueue(self, key, antenna_type, antenna_params, scans=None):
+        """
+        Adds a job unless the same design (or sweep) is already queued or running
+        """
+
+        status = self.status(key)
+        attempts = 0
+        if self.stalled(status):
+            if not self.lost(key):
+                return False
+            attempts = int(status.get('attempts', 0)) + 1
+        if status.get('state') in ('done', 'failed') or attempts:
+            self.conn.delete(self.prefix + key)
+        if not self.conn.hsetnx(self.prefix + key, 'state', 'queued'):
+            return False
+        pipe = self.conn.pipeline()
+        pipe.hset(self.prefix + key, 'stage', 'queued')
+        if attempts:
+            pipe.hset(self.prefix + key, 'attempts', attempts)
+        pipe.expire(self.prefix + key, self.session_time)
+        job = [key, antenna_type, antenna_params] + ([list(map(float, scans))] if scans is not None else [])
+        pipe.lpush(self.queue, json.dumps(job))
+        pipe.execute()
+        return True
+
+    @staticmethod
+    def worker_id(pid=None):
+        return f'{socket.gethostname()}:{pid or os.getpid()}'
+
+    def next(self, worker, timeout=0):
+        job = self.conn.brpoplpush(self.queue, self.processing + worker, timeout)
+        return json.loads(job) if job else None
+
+    def finish(self, worker):
+        self.conn.delete(self.processing + worker)
+
+    def lost(self, key):
+        """
+        Counts a loss of the job, marks it failed once it has been lost max_attempts times.
+        Returns whether it may run again
+        """
+
+        if self.conn.hincrby(self.prefix + key, 'attempts', 1) < self.max_attempts:
+            return True
+        self.update(key, state='failed', stage='failed', error=self.lost_error)
+        return False
+
+    def requeue(self, worker):
+        """
+        Puts the jobs taken by a worker that died back at the head of the queue, unless they
+        have killed workers max_attempts times. Returns the numbers of requeued and failed jobs
+        """
+
+        pipe = self.conn.pipeline()
+        pipe.lrange(self.processing + worker, 0, -1)
+        pipe.delete(self.processing + worker)
+        taken = pipe.execute()[0]
+        requeued = [job for job in taken if self.lost(json.loads(job)[0])]
+        for job in requeued:
+            key = json.loads(job)[0]
+            pipe.hmset(self.prefix + key, {'state': 'queued', 'stage': 'queued'})
+            pipe.expire(self.prefix + key, self.session_time)
+            pipe.rpush(self.queue, job)
+        pipe.execute()
+        return len(requeued), len(taken) - len(requeued)
+
+    def update(self, key, **fields):
+        self.conn.hmset(self.prefix + key, dict(fields, heartbeat=time.time()))
+        self.conn.expire(self.prefix + key, self.session_time)
+
+    def stalled(self, status):
+        """
+        Whether a job is running in a worker that is gone
+        """
+
+        return status.get('state') == 'running' and \
+            time.time() - float(status.get('heartbeat', 0)) > self.stale_after
+
+    def status(self, key):
+        return {field.decode(): value.decode() for field, value in self.conn.hgetall(self.prefix + key).items()}
+
+
+class Metrics(Storage):
+    """
+    Latency histograms of the computation stages, shared by all the workers
+    and exposed in the Prometheus text format
+    """
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    prefix = 'metrics:'
+    name = 'antennapp_stage_seconds'
+
+    def observe(self, stages):
+        pipe = self.conn.pipeline()
+        for stage, seconds in stages.items():
+            le = next((f'{le:g}' for le in self.buckets if seconds <= le), '+Inf')
+            pipe.hincrby(self.prefix + 'buckets', f'{stage}|{le}', 1)
+            pipe.hincrbyfloat(self.prefix + 'sum', stage, seconds)
+            pipe.hincrby(self.prefix + 'count', stage, 1)
+        pipe.execute()
+
+    def exposition(self):
+        pipe = self.conn.pipeline()
+        for field in ('buckets', 'sum', 'count'):
+            pipe.hgetall(self.prefix + field)
+        buckets, sums, counts = ({key.decode(): value.decode() for key, value in values.items()}
+                                 for values in pipe.execute())
+
+        lines = [f'# HELP {self.name} Duration of the computation stages of a design',
+                 f'# TYPE {self.name} histogram']
+        for stage in sorted(counts):
+            cumulative = 0
+            for le in [f'{le:g}' for le in self.buckets] + ['+Inf']:
+                cumulative += int(buckets.get(f'{stage}|{le}', 0))
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {sums.get(stage, 0)}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {counts[stage]}')
+        return '\n'.join(lines) + '\n'
+
+
+class LocalJobQueue:
+    """
+    In-process stand-in for JobQueue for local testing:
+    jobs run on a bounded thread pool, statuses are kept in a dict
+    """
+
+    def __init__(self, workers=2):
+        self._statuses = dict()
+        self._lock = Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def enqueue(self, key, antenna_type, antenna_params, scans=None):
+        from .jobs import run_job
+
+        with self._lock:
+            if self._statuses.get(key, {}).get('state') in ('queued', 'running'):
+                return False
+            self._statuses[key] = {'state': 'queued', 'stage': 'queued'}
+        self._pool.submit(run_job, self, key, antenna_type, json.loads(json.dumps(antenna_params)),
+                          None if scans is None else list(map(float, scans)))
+        return True
+
+    def update(self, key, **fields):
+        with self._lock:
+            self._statuses.setdefault(key, {}).update({field: str(value) for field, value in fields.items()})
+
+    def status(self, key):
+        with self._lock:
+            return dict(self._statuses.get(key, {}))
+
+    def stalled(self, status):
+        # the threads die only with the web process
+        return False
+
+
+class DesignCache(Storage):
+    """
+    Parameters of the designs by key, kept as long as their results,
+    so that a sweep or a lost job can be computed again from them
+    """
+    session_time = ResultCache.session_time
+
+
+cache = DesignCache()
+results = ResultCache()
+metrics = Metrics()
+jobs = LocalJobQueue(settings.JOB_WORKERS) if settings.JOB_QUEUE == 'local' else JobQueue()
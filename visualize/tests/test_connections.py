@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from numpy import sin, exp
+
+from visualize.Antenna import Antenna, ControlledConnections, SubArrayControlledConnections
+
+RESOLUTION = 721
+
+
+def errors(n_array, seed=0):
+    rng = np.random.RandomState(seed)
+    return dict(a_apd=rng.normal(0, 0.1, size=(n_array, 1)), ph_apd=rng.normal(0, np.radians(5), size=(n_array, 1)),
+                a_rand=rng.normal(0, 0.01, size=(n_array, 1)), ph_rand=rng.normal(0, np.radians(0.5), size=(n_array, 1)))
+
+
+def reference_connections(antenna, element_diagram, elements):
+    """
+    The controlled connections loop summed directly: every iteration every interference
+    is subtracted from the element diagram of the given elements
+    """
+
+    element_diagram = element_diagram.copy()
+    n, fi = antenna.n[elements], antenna.Fi_apd[elements] + antenna.Fi_rand[elements]
+    weights = antenna.A[elements] / antenna.A.sum()
+    for _ in range(antenna.It):
+        element = np.zeros_like(element_diagram)
+        for r, ind in enumerate(antenna.cl_index):
+            direction = antenna.theta[ind + antenna.b_err[r]]
+            # первые фазовращатели
+            pattern_sum = (element_diagram * exp(-1j * (n * sin(direction) * antenna.phase_factor - fi))).sum(axis=0)
+            # вторые фазовращатели
+            element -= weights * pattern_sum * exp(1j * (n * sin(direction) * antenna.phase_factor + fi))
+        element_diagram += element
+    return element_diagram
+
+
+def reference_diagram(antenna, element_diagram, scan):
+    pattern = (element_diagram * antenna.set_scan(scan)).sum(axis=0)
+    return np.absolute(pattern / np.max(pattern))
+
+
+@pytest.mark.parametrize('n_array, ph_interference, iteration, boresight_err', [
+    (16, [20.], 1, None),
+    (29, [20., -30., 45.], 7, None),
+    (24, [-50., 10.], 100, np.array([3, -2]))
+])
+def test_controlled_connections_match_direct_summation(n_array, ph_interference, iteration, boresight_err):
+    antenna = ControlledConnections(n_array, ph_interference, iteration=iteration, boresight_err=boresight_err,
+                                    resolution=RESOLUTION, **errors(n_array))
+    expected = reference_connections(antenna, Antenna.get_element_diagram(antenna), slice(None))
+
+    np.testing.assert_allclose(antenna.element_diagram, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(antenna.get_diagram(10), reference_diagram(antenna, expected, 10), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('n_array, sub_array', [(24, 4), (10, 3)])
+def test_sub_arrays_match_direct_summation(n_array, sub_array):
+    antenna = SubArrayControlledConnections(n_array, [20., -30.], iteration=5, sub_array=sub_array,
+                                            resolution=RESOLUTION, **errors(n_array))
+    expected = Antenna.get_element_diagram(antenna)
+    size = n_array // sub_array
+    # elements left over after the partition are not connected
+    for start in range(0, size * sub_array, size):
+        elements = slice(start, start + size)
+        expected[elements] = reference_connections(antenna, expected[elements], elements)
+
+    np.testing.assert_allclose(antenna.element_diagram, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(antenna.get_diagram(-5), reference_diagram(antenna, expected, -5), rtol=0, atol=1e-12)
@@ -0,0 +1,39 @@
+import numpy as np
+
+from visualize.decimation import minmax_indices, decimate_pattern, FLOOR_DB
+
+
+def pattern(n=10000):
+    theta_deg = np.linspace(-90, 90, n)
+    with np.errstate(divide='ignore'):
+        diagram = 20 * np.log10(np.absolute(np.sinc(theta_deg / 4)))
+    return theta_deg, diagram
+
+
+def test_minmax_keeps_nulls_peaks_ends_and_kept_indices():
+    theta_deg, diagram = pattern()
+    keep = [1234, 5678]
+    index = minmax_indices([diagram], 200, keep=keep)
+
+    assert len(index) <= 200 + len(keep) + 2
+    assert {0, len(diagram) - 1, *keep} <= set(index)
+    assert np.argmax(diagram) in index
+    # every null of sin(x)/x within a bucket survives as the bucket minimum
+    bucket = -(-len(diagram) // 100)
+    for start in range(0, len(diagram), bucket):
+        block = diagram[start: start + bucket]
+        assert start + np.argmin(np.nan_to_num(block, neginf=FLOOR_DB)) in index
+
+
+def test_short_series_is_not_reduced():
+    assert list(minmax_indices([np.arange(50.)], 200)) == list(range(50))
+
+
+def test_decimate_pattern_locates_the_interferences():
+    theta_deg, diagram = pattern()
+    cl_index = [2000, 7000]
+    columns, interferences = decimate_pattern({'theta_deg': theta_deg, 'diagram': diagram, 'cl_index': cl_index},
+                                              points=300)
+
+    assert list(columns['theta_deg'][interferences]) == list(theta_deg[cl_index])
+    assert np.all(np.isfinite(columns['diagram'])) and np.min(columns['diagram']) >= FLOOR_DB
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from visualize.core import design_key
+
+PARAMS = dict(n_array=29, scan=0., random_state=42, a_sigma=0.1, ph_sigma=5., ph_interference=[20., -30., 45.],
+              a=1., a_rand=0.01, ph_rand=0.5, iteration=5, boresight_err='no_err', precision='double')
+
+
+def test_key_does_not_depend_on_the_order_of_parameters_and_directions():
+    shuffled = dict(reversed(list(PARAMS.items())), ph_interference=[45., 20., -30.])
+
+    assert design_key(shuffled, 'controlled_connections') == design_key(PARAMS, 'controlled_connections')
+
+
+def test_key_depends_on_the_values_and_the_type():
+    key = design_key(PARAMS, 'controlled_connections')
+
+    assert design_key(dict(PARAMS, iteration=6), 'controlled_connections') != key
+    assert design_key(dict(PARAMS, ph_interference=[20., -30.]), 'controlled_connections') != key
+    assert design_key(PARAMS, 'adaptive_filtering') != key
+
+
+def test_key_does_not_depend_on_the_hash_seed():
+    # directions built from a set come in an order that depends on PYTHONHASHSEED
+    code = ('from visualize.core import design_key; '
+            f'params = dict({PARAMS!r}, ph_interference=list({{"20", "-30", "45", "-55.5"}})); '
+            'params["ph_interference"] = [float(x) for x in params["ph_interference"]]; '
+            'print(design_key(params, "controlled_connections"))')
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    keys = {subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True,
+                           env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout for seed in range(4)}
+
+    assert len(keys) == 1
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from visualize.Antenna import Antenna, ControlledConnections, AdaptiveAntenna
+from .test_connections import errors
+
+
+@pytest.mark.parametrize('model, args', [
+    (Antenna, ()),
+    (ControlledConnections, ([20., -30., 45.],)),
+    (AdaptiveAntenna, ([20., -30.],))
+])
+def test_fft_backend_matches_direct(model, args):
+    direct = model(64, *args, iteration=10, **errors(64))
+    fft = model(64, *args, iteration=10, backend='fft', **errors(64))
+
+    np.testing.assert_allclose(fft.get_diagram(15), direct.get_diagram(15), rtol=0, atol=1e-5)
+
+
+def test_fft_backend_on_an_adaptive_grid():
+    direct = Antenna(29, **errors(29))
+    fft = Antenna(29, backend='fft', grid='adaptive', **errors(29))
+    pattern = fft.get_diagram(-20)
+
+    np.testing.assert_allclose(pattern, direct.get_diagram(-20)[fft.grid_index], rtol=0, atol=1e-5)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from visualize.pattern_metrics import pattern_metrics
+
+THETA_DEG = np.linspace(-90, 90, 3601)
+
+
+def sinc_pattern(center=0., width=10.):
+    """
+    sin(x) / x lobes in dB: -3 dB beamwidth 0.8847 width, first nulls at center ± width
+    and the first sidelobes at -13.26 dB
+    """
+
+    return 10 * np.log10(np.maximum(np.sinc((THETA_DEG - center) / width) ** 2, 1e-30))
+
+
+def index(angle):
+    return int(np.argmin(np.absolute(THETA_DEG - angle)))
+
+
+def test_sinc_lobe():
+    metrics = pattern_metrics(THETA_DEG, sinc_pattern(), index(1), cl_index=[index(30)])
+
+    assert metrics['beamwidth'] == pytest.approx(0.8847 * 10, abs=0.01)
+    assert metrics['null_width'] == pytest.approx(20)
+    assert metrics['sidelobe_peak'] == pytest.approx(-13.26, abs=0.01)
+    assert metrics['sidelobe_mean'] < metrics['sidelobe_peak']
+    assert metrics['null_depths'][0] < -100
+
+
+def test_ripple_above_half_power_is_part_of_the_lobe():
+    diagram = sinc_pattern() - 1.5 * np.exp(-((THETA_DEG - 2) / 0.5) ** 2)
+    metrics = pattern_metrics(THETA_DEG, diagram, index(0))
+
+    assert THETA_DEG[list(metrics['first_nulls'])] == pytest.approx([-10, 10])
+    assert metrics['beamwidth'] == pytest.approx(0.8847 * 10, abs=0.05)
+
+
+def test_lobe_reaching_the_end_of_the_grid():
+    # the right half-power point lies beyond 90°
+    diagram = sinc_pattern(center=85, width=20)
+    metrics = pattern_metrics(THETA_DEG, diagram, index(85))
+
+    assert np.isnan(metrics['crossings'][1])
+    assert metrics['beamwidth'] == pytest.approx(0.8847 * 20, abs=0.02)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from numpy import sin, cos, exp
+
+from visualize.Antenna import Antenna, ControlledConnections, PlanarAntenna, PlanarControlledConnections
+from .test_connections import RESOLUTION, errors
+
+
+def brute_force_cut(antenna, weights, phi):
+    """
+    Pattern of N x 1 weights in the plane phi (radians) summed over every element position
+    """
+
+    positions = (antenna.nx * cos(phi) + antenna.ny.T * sin(phi)).reshape(-1, 1)
+    return (weights * exp(1j * positions * sin(antenna.theta) * antenna.phase_factor)).sum(axis=0)
+
+
+@pytest.mark.parametrize('phi', [0., 30., 90., 135.])
+@pytest.mark.parametrize('backend, tolerance', [('direct', 1e-10), ('fft', 1e-5)])
+def test_separable_cuts_match_brute_force(phi, backend, tolerance):
+    antenna = PlanarAntenna(7, n_rows=5, phi=20, resolution=RESOLUTION, backend=backend, **errors(35))
+    weights = antenna.array_weights(antenna.set_scan(10))
+    expected = brute_force_cut(antenna, weights, np.radians(phi))
+
+    np.testing.assert_allclose(antenna.cut_factors(weights, np.radians(phi))[0], expected,
+                               rtol=0, atol=tolerance * np.max(np.absolute(expected)))
+
+
+def test_planar_connections_match_dense_operator():
+    antenna = PlanarControlledConnections(6, [20., -30.], n_rows=4, phi=30, iteration=7, resolution=RESOLUTION,
+                                          **errors(24))
+    expected = np.dot(ControlledConnections.get_connections(antenna), Antenna.get_element_diagram(antenna))
+
+    np.testing.assert_allclose(antenna.element_diagram, expected, rtol=0, atol=1e-12)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from visualize.Antenna import AdaptiveAntenna
+
+SAMPLES = 3000
+
+
+def direct_weights(antenna, scan, forgetting, window, loading=1.):
+    """
+    R^-1 S for the covariance of the snapshots discounted by forgetting and cut to the window,
+    plus the initial loading * I discounted over all the snapshots
+    """
+
+    snapshots = antenna.clatter_generator()
+    discount = forgetting ** np.arange(SAMPLES - 1, -1, -1)
+    if window:
+        discount[:SAMPLES - window] = 0
+    R = np.dot(snapshots.T * discount, np.conj(snapshots)) / 2 + loading * forgetting ** SAMPLES * np.eye(antenna.N)
+    S = antenna.phase_shift(sign=-1, shift=np.radians([scan]))[:, 0]
+    return np.linalg.solve(R, S)
+
+
+@pytest.mark.parametrize('forgetting, window', [(1., None), (0.99, None), (0.95, None), (1., 50), (0.97, 100)])
+def test_recursive_weights_match_direct_solve(forgetting, window):
+    antenna = AdaptiveAntenna(16, [20., -30.], sample_size=SAMPLES)
+    counts, weights = antenna.recursive_weights(10, forgetting, window, every=SAMPLES)
+    expected = direct_weights(antenna, 10, forgetting, window)
+
+    assert list(counts) == [SAMPLES]
+    assert np.all(np.isfinite(weights))
+    np.testing.assert_allclose(weights[:, -1], expected, rtol=0, atol=1e-8 * np.max(np.absolute(expected)))
+
@@ -0,0 +1,54 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'antennapp.settings')
+# the client connects lazily, these tests never reach Redis
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+from visualize import views  # noqa: E402
+
+KEY = '0' * 32
+
+
+class Unreachable:
+    def get(self, key):
+        raise AssertionError('a conditional request must not fetch the result')
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(views, 'results', Unreachable())
+
+
+def test_result_page_revalidates_without_fetching(storage):
+    etag = views.result_etag(KEY, f'page{views.PAGE_VERSION}')
+    request = RequestFactory().get(f'/antenna/result/{KEY}', HTTP_IF_NONE_MATCH=etag)
+    response = views.ResultView.as_view()(request, user_key=KEY, antenna_type='antenna')
+
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert 'no-cache' in response['Cache-Control']
+
+
+def test_image_revalidates_without_fetching(storage):
+    etag = views.result_etag(KEY, f'image-r{views.RENDERER_VERSION}')
+    request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=etag)
+    response = views.ImageView.as_view()(request, user_key=KEY, antenna_type='antenna',
+                                         version=views.RENDERER_VERSION, name='image')
+
+    assert response.status_code == 304
+    assert 'immutable' in response['Cache-Control']
+
+
+def test_stale_etag_and_other_renderer_versions(storage):
+    request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=views.result_etag(KEY, 'image-r0'))
+
+    assert views.not_modified(request, views.result_etag(KEY, f'image-r{views.RENDERER_VERSION}'),
+                              views.IMAGE_CACHE_CONTROL) is None
+    response = views.ImageView.as_view()(request, user_key=KEY, antenna_type='antenna',
+                                         version=views.RENDERER_VERSION + 1, name='image')
+    assert response.status_code == 404
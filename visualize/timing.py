@@ -0,0 +1,69 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Timings:
+    """
+    Durations of the named stages of one computation, seconds.
+    A stage started inside another one is named after both: base.model
+    """
+
+    def __init__(self):
+        self.stages = dict()
+        self._stack = list()
+
+    @contextmanager
+    def stage(self, name):
+        self._stack.append(name)
+        path = '.'.join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[path] = self.stages.get(path, 0.) + time.perf_counter() - start
+            self._stack.pop()
+
+
+class _Idle:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_idle = _Idle()
+
+
+def stage(name):
+    """
+    Times a stage of the computation collected in this thread, does nothing if none is
+    """
+
+    timings = getattr(_local, 'timings', None)
+    return _idle if timings is None else timings.stage(name)
+
+
+@contextmanager
+def collect(timings):
+    """
+    Collects the stages run in this thread into timings (if not None)
+    """
+
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def server_timing(stages):
+    """
+    Value of a Server-Timing header, durations in milliseconds
+    """
+
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in stages.items())
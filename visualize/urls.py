@@ -4,6 +4,11 @@ from . import views
 app_name = 'visualize'
 urlpatterns = [
     path('', views.InputView.as_view(), name='input-view'),
+    path('metrics', views.MetricsView.as_view(), name='metrics-view'),
     path('<antenna_type>/', views.ParamView.as_view(), name='param-view'),
-    path('<antenna_type>/result/<user_key>', views.ResultView.as_view(), name='result-view')
+    path('<antenna_type>/result/<user_key>', views.ResultView.as_view(), name='result-view'),
+    path('<antenna_type>/image/<user_key>/<int:version>/<name>.png', views.ImageView.as_view(), name='image-view'),
+    path('<antenna_type>/progress/<user_key>', views.ProgressView.as_view(), name='progress-view'),
+    path('<antenna_type>/pattern/<user_key>', views.PatternView.as_view(), name='pattern-view'),
+    path('<antenna_type>/sweep/<user_key>', views.SweepView.as_view(), name='sweep-view')
 ]
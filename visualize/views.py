@@ -1,12 +1,53 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, render_to_response
-from django.http import HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, JsonResponse
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
-import random
-import string
+from django.views.decorators.gzip import gzip_page
+import base64
 import json
-from .forms import InputForm, AntennaForm, ControlledConnectionsForm, AdaptiveFilteringForm
-from .core import create_antenna
-from .storage import cache
+import time
+import numpy as np
+from .forms import InputForm, AntennaForm, ControlledConnectionsForm, AdaptiveFilteringForm, SweepForm
+from .core import design_key, canonical_params, sweep_key, RENDERER_VERSION
+from .decimation import decimate_pattern
+from .storage import cache, results, jobs, metrics
+from .jobs import STAGES
+from .timing import server_timing
+
+# bump whenever the result page templates change, so that revalidated pages are rendered anew
+PAGE_VERSION = 2
+IMAGES = ('image', 'planar_image', 'clutter_image', 'scatter_image', 'convergence_image')
+# the page is revalidated on every visit, an image never changes under its address
+PAGE_CACHE_CONTROL = {'public': True, 'no_cache': True}
+IMAGE_CACHE_CONTROL = {'public': True, 'max_age': 365 * 24 * 3600, 'immutable': True}
+
+
+def result_etag(user_key, part):
+    """
+    Strong ETag of a part of a result: the design key is already a hash
+    of the canonical parameters, MODEL_VERSION and RENDERER_VERSION
+    """
+
+    return f'"{user_key}-{part}"'
+
+
+def cacheable(response, etag, cache_control):
+    response['ETag'] = etag
+    patch_cache_control(response, **cache_control)
+    return response
+
+
+def not_modified(request, etag, cache_control):
+    """
+    304 (or 412) for a conditional request that the client can answer from its copy, None otherwise.
+    Nothing is fetched or computed: the content under an etag never changes
+    """
+
+    response = get_conditional_response(request, etag=etag,
+                                        response=cacheable(HttpResponse(), etag, cache_control))
+    return None if response.status_code == 200 else response
 
 
 class InputView(View):
@@ -47,8 +88,11 @@ class ParamView(View):
     def post(self, request, **kwargs):
         form = self.form(request.POST)
         if form.is_valid() and form.cleaned_data:
-            user_key = ''.join(random.choices(string.ascii_lowercase + string.digits, k=16))
-            cache.set(user_key, json.dumps(form.cleaned_data))
+            antenna_params = canonical_params(dict(form.cleaned_data, precision=settings.MODEL_PRECISION))
+            user_key = design_key(antenna_params, self.kwargs['antenna_type'])
+            cache.set(user_key, json.dumps(antenna_params))
+            if user_key not in results:
+                jobs.enqueue(user_key, self.kwargs['antenna_type'], antenna_params)
             return redirect(f'result/{user_key}')
         else:
             return render(request, 'visualize/error.html', {'errors': form.errors})
@@ -56,18 +100,166 @@ class ParamView(View):
 
 class ResultView(View):
     def get(self, request, user_key, antenna_type):
+        etag = result_etag(user_key, f'page{PAGE_VERSION}')
+        response = not_modified(request, etag, PAGE_CACHE_CONTROL)
+        if response is not None:
+            return response
 
-        try:
-            antenna_params = json.loads(cache.get(user_key))
-        except TypeError:
+        start = time.perf_counter()
+        result = results.get(user_key)
+        fetched = time.perf_counter()
+        if result is None:
+            response = self.pending(request, user_key, antenna_type)
+            # the progress and error pages must not be taken for the result
+            add_never_cache_headers(response)
+            return response
+
+        context = {
+            'result': result,
+            'antenna_type': antenna_type,
+            'user_key': user_key,
+            'renderer_version': RENDERER_VERSION
+        }
+
+        response = render(request, 'visualize/results.html', context)
+        # stages of the computation in the worker, then the work of this request
+        stages = dict(result.get('timings') or {})
+        stages.update({'fetch': fetched - start, 'template': time.perf_counter() - fetched})
+        response['Server-Timing'] = server_timing(stages)
+        return cacheable(response, etag, PAGE_CACHE_CONTROL)
+
+    @staticmethod
+    def pending(request, key, antenna_type, user_key=None, scans=None):
+        """
+        Progress page of the job computing results[key], enqueued again if it is gone or stalled.
+        The scan sweep (scans) of the design user_key is a job of its own
+        """
+
+        status = jobs.status(key)
+        if status.get('state') == 'failed':
             return render(request, 'visualize/error.html',
-                          {'errors': {antenna_type: 'Время сессии истекло'}})
+                          {'errors': {antenna_type: status.get('error')}})
+
+        if status.get('state') not in ('queued', 'running') or jobs.stalled(status):
+            try:
+                antenna_params = json.loads(cache.get(user_key or key))
+            except TypeError:
+                return render(request, 'visualize/error.html',
+                              {'errors': {antenna_type: 'Время сессии истекло'}})
+            jobs.enqueue(key, antenna_type, antenna_params, scans)
+
+        context = {
+            'antenna_type': antenna_type,
+            'user_key': key
+        }
+        return render(request, 'visualize/progress.html', context)
+
+
+class ImageView(View):
+    """
+    PNG of a computed result at its own address, so browsers and CDN edges keep it
+    and repeat views do not fetch the result at all. The address and the ETag
+    name the renderer version, images of an older renderer are not served
+    """
+
+    def get(self, request, user_key, antenna_type, version, name):
+        if name not in IMAGES or version != RENDERER_VERSION:
+            return HttpResponseNotFound()
+        etag = result_etag(user_key, f'{name}-r{version}')
+        response = not_modified(request, etag, IMAGE_CACHE_CONTROL)
+        if response is not None:
+            return response
+
+        result = results.get(user_key)
+        if result is None or not result.get(name):
+            response = HttpResponseNotFound()
+            add_never_cache_headers(response)
+            return response
+        return cacheable(HttpResponse(base64.b64decode(result[name]), content_type='image/png'),
+                         etag, IMAGE_CACHE_CONTROL)
+
+
+class ProgressView(View):
+    def get(self, request, user_key, antenna_type):
+        status = jobs.status(user_key)
+        if jobs.stalled(status):
+            # the page reloads and the job is enqueued again
+            status['state'] = 'stalled'
+        status['ready'] = user_key in results
+        status['label'] = STAGES.get(status.get('stage'), '')
+        return JsonResponse(status)
+
+
+@method_decorator(gzip_page, name='dispatch')
+class PatternView(View):
+    """
+    Decimated pattern of a computed result for client-side plotting:
+    ?points=<target number of samples>&format=json|float32
+    """
+    max_points = 20000
+
+    def get(self, request, user_key, antenna_type):
+        result = results.get(user_key)
+        if result is None:
+            return JsonResponse({'ready': False}, status=404)
+
+        try:
+            points = min(max(int(request.GET.get('points', 2000)), 10), self.max_points)
+        except ValueError:
+            return JsonResponse({'error': 'points должно быть целым числом'}, status=400)
+
+        columns, interferences = decimate_pattern(result, points)
+
+        if request.GET.get('format') == 'float32':
+            # rows of little-endian float32, one per column named in X-Pattern-Columns
+            response = HttpResponse(np.vstack(list(columns.values())).astype('<f4').tobytes(),
+                                    content_type='application/octet-stream')
+            response['X-Pattern-Columns'] = ','.join(columns)
+            response['X-Pattern-Interferences'] = ','.join(map(str, interferences))
+            return response
+
+        data = {name: np.round(values, 3).tolist() for name, values in columns.items()}
+        data['interferences'] = interferences.tolist()
+        data['total'] = len(result['theta_deg'])
+        return JsonResponse(data)
+
+
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SweepView(View):
+    """
+    Scan sweep of a design, computed by the workers and cached like the design itself
+    """
+
+    def get(self, request, user_key, antenna_type):
+        form = SweepForm(request.GET or {field: SweepForm.base_fields[field].initial
+                                         for field in SweepForm.base_fields})
+        if not form.is_valid():
+            return render(request, 'visualize/error.html', {'errors': form.errors})
+
+        scans = form.get_scans()
+        key = sweep_key(user_key, scans)
+        etag = result_etag(key, f'sweep{PAGE_VERSION}')
+        response = not_modified(request, etag, PAGE_CACHE_CONTROL)
+        if response is not None:
+            return response
 
-        _model = create_antenna(antenna_params, antenna_type)
+        result = results.get(key)
+        if result is None:
+            response = ResultView.pending(request, key, antenna_type, user_key, scans)
+            add_never_cache_headers(response)
+            return response
 
         context = {
-            'result': _model,
-            'antenna_type': antenna_type
+            'result': result,
+            'antenna_type': antenna_type,
+            'user_key': user_key,
+            'sweep_key': key,
+            'renderer_version': RENDERER_VERSION,
+            'form': form
         }
 
-        return render(request, 'visualize/results.html', context)
+        return cacheable(render(request, 'visualize/sweep.html', context), etag, PAGE_CACHE_CONTROL)
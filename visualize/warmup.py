@@ -0,0 +1,18 @@
+import numpy as np
+
+
+def warmup(precision='double', n_arrays=(29,)):
+    """
+    Imports the heavy dependencies, primes the steering matrices of the default designs
+    and renders a dummy diagram. Called before the server forks its workers,
+    so that they start with all of it already in memory
+    """
+
+    import scipy.linalg
+    from .Antenna import Antenna
+    from .image_generator import DiagramImage
+
+    for n_array in n_arrays:
+        antenna = Antenna(n_array=n_array, precision=precision)
+        diagram = 20 * np.log10(antenna.get_diagram(0))
+    DiagramImage(antenna, diagram).get_image()